@@ -1,13 +1,40 @@
 import bcrypt
 
+# Algorithm used for new hashes (stored in User.password_algo)
+DEFAULT_PASSWORD_ALGO = 'bcrypt'
+BCRYPT_ROUNDS = 12
+
+def _bcrypt_verify(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+def _bcrypt_needs_rehash(hashed_password: str) -> bool:
+    # Modular crypt format: $2b$<cost>$<salt+digest>
+    try:
+        cost = int(hashed_password.split('$')[2])
+    except (IndexError, ValueError):
+        return True
+    return cost < BCRYPT_ROUNDS
+
+# Verifiers keyed by User.password_algo, so login doesn't have to sniff the hash format
+PASSWORD_VERIFIERS = {
+    'bcrypt': _bcrypt_verify,
+}
+
 def get_password_hash(password: str) -> str:
     """Hash a password for storing."""
     pwd_bytes = password.encode('utf-8')
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     return bcrypt.hashpw(pwd_bytes, salt).decode('utf-8')
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def verify_password(plain_password: str, hashed_password: str, algo: str = None) -> bool:
     """Verify a stored password against one provided by user"""
-    pwd_bytes = plain_password.encode('utf-8')
-    hash_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(pwd_bytes, hash_bytes)
+    verifier = PASSWORD_VERIFIERS.get(algo or DEFAULT_PASSWORD_ALGO)
+    if verifier is None:
+        return False
+    return verifier(plain_password, hashed_password)
+
+def needs_rehash(hashed_password: str, algo: str = None) -> bool:
+    """True if the stored hash should be upgraded to the current algorithm/cost"""
+    if (algo or DEFAULT_PASSWORD_ALGO) != DEFAULT_PASSWORD_ALGO:
+        return True
+    return _bcrypt_needs_rehash(hashed_password)
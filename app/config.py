@@ -9,12 +9,23 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = os.getenv("ENVIRONMENT", "development")
 
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./insurance_analyzer.db")
+    # Connection pool (ignored for SQLite)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 10))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", 20))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", 1800)) # Seconds, below typical server/proxy idle timeouts
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     SECRET_KEY: str = os.getenv("SECRET_KEY", "changeme")
     SESSION_TIMEOUT_HOURS: int = int(os.getenv("SESSION_TIMEOUT_HOURS", 8))
     MAX_UPLOAD_SIZE_MB: int = int(os.getenv("MAX_UPLOAD_SIZE_MB", 100)) # Increased limit
+    MAX_CONCURRENT_OCR_JOBS: int = int(os.getenv("MAX_CONCURRENT_OCR_JOBS", 2)) # Per worker process; jobs share OCR_CONCURRENCY Tesseract threads
+    MAX_CONCURRENT_ANALYSES: int = int(os.getenv("MAX_CONCURRENT_ANALYSES", 4)) # Per worker process, LLM-bound
+    MAX_CONCURRENT_PDF_RENDERS: int = int(os.getenv("MAX_CONCURRENT_PDF_RENDERS", 2)) # Per worker process, CPU-bound
     DEFAULT_USERS: str = os.getenv("DEFAULT_USERS", "admin:changeme123")
     
+    # Optional Redis (shared login throttling across workers)
+    REDIS_URL: str = os.getenv("REDIS_URL", "")
+    
     # App URL for password reset links
     APP_URL: str = os.getenv("APP_URL", "http://localhost:5173")
     
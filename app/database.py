@@ -8,8 +8,18 @@ from .auth import get_password_hash
 # check_same_thread=False is needed only for SQLite
 connect_args = {"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
 
+# Explicit pool for server databases: the defaults (5 + 10 overflow, no pre-ping)
+# time out under concurrent dashboard polling and hand out stale connections
+pool_args = {} if "sqlite" in settings.DATABASE_URL else {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+    "pool_pre_ping": True,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+}
+
 engine = create_engine(
-    settings.DATABASE_URL, connect_args=connect_args
+    settings.DATABASE_URL, connect_args=connect_args, **pool_args
 )
 
 # Enable Write-Ahead Logging for SQLite
@@ -59,3 +69,13 @@ def init_db():
         print(f"Error initializing DB: {e}")
     finally:
         db.close()
+    
+    # System settings singleton (reads never create it)
+    from .system_settings import init_settings_row
+    db = SessionLocal()
+    try:
+        init_settings_row(db)
+    except Exception as e:
+        print(f"Error initializing system settings: {e}")
+    finally:
+        db.close()
@@ -9,7 +9,10 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from .config import settings
 from .database import engine, Base, init_db
+from .services.maintenance import run_nightly_maintenance
+from . import ocr
 from .routes import auth_routes, upload_routes, analysis_routes, claims_routes, admin_routes, stripe_routes, compare_routes, prospect_routes, chat_routes
+import asyncio
 import uvicorn
 
 # 🔒 SECURITY: Rate limiting to prevent DOS attacks
@@ -138,8 +141,18 @@ app.include_router(prospect_routes.router) # Router already has prefix /api/pros
 app.include_router(chat_routes.router, prefix="/api/chat", tags=["Chat"])
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     init_db()
+    # Nightly cleanup + usage rollup (claimed by one worker process per night)
+    app.state.maintenance_task = asyncio.create_task(run_nightly_maintenance())
+    # Pre-load the Doctr model so the first OCR request doesn't pay the cold load
+    if ocr.OCR_USE_DOCTR:
+        await asyncio.to_thread(ocr.get_doctr_model)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Free the Doctr weights (and cached GPU memory) before the worker exits
+    ocr.release_models()
 
 if __name__ == "__main__":
     uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
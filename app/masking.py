@@ -1,4 +1,5 @@
 import json
+import re
 
 def mask_document(text: str, sensitive_data: dict) -> tuple[str, list[dict], dict]:
     """
@@ -19,11 +20,22 @@ def mask_document(text: str, sensitive_data: dict) -> tuple[str, list[dict], dic
     - lista_sostituzioni: per mostrare all'utente cosa è stato sostituito
     - reverse_mapping: dizionario {placeholder: valore_originale} per ripopolamento
     """
-    import re
+    chunks = [text]
+    replacements, reverse_mapping = mask_chunks(chunks, sensitive_data)
+    return chunks[0], replacements, reverse_mapping
+
+
+def mask_chunks(chunks: list[str], sensitive_data: dict) -> tuple[list[dict], dict]:
+    """
+    Come mask_document, ma su una lista di pezzi di testo (es. intestazione e
+    contenuto di ogni documento), mascherati IN PLACE: il testo completo non
+    viene mai ricostruito. Le occorrenze sono sommate su tutti i pezzi; un
+    valore a cavallo tra due pezzi non viene trovato.
     
+    Ritorna (lista_sostituzioni, reverse_mapping).
+    """
     replacements = []
     reverse_mapping = {}  # mask -> originale
-    masked = text
     
     field_masks = {
         'numero_polizza': '[POLIZZA_XXX]',
@@ -36,27 +48,12 @@ def mask_document(text: str, sensitive_data: dict) -> tuple[str, list[dict], dic
         'cap': '[CAP_XXX]'
     }
     
+    # (campo, valore, mask) nell'ordine di sostituzione
+    targets = []
     for field, mask in field_masks.items():
         value = sensitive_data.get(field, '').strip()
         if value:
-            # Escape regex characters in value
-            pattern = re.escape(value)
-            # Find all occurrences (case insensitive)
-            flag = re.IGNORECASE
-            
-            # Count occurrences before replacement
-            count = len(re.findall(pattern, masked, flags=flag))
-            
-            if count > 0:
-                # Perform replacement
-                masked = re.sub(pattern, mask, masked, flags=flag)
-                reverse_mapping[mask] = value
-                replacements.append({
-                    'campo': field,
-                    'originale': value,
-                    'mascherato': mask,
-                    'occorrenze': count
-                })
+            targets.append((field, value, mask))
     
     # Altri dati custom
     altri = sensitive_data.get('altri', [])
@@ -66,21 +63,28 @@ def mask_document(text: str, sensitive_data: dict) -> tuple[str, list[dict], dic
     for i, dato in enumerate(altri, 1):
         dato = dato.strip()
         if dato:
-            mask = f'[DATO_OSCURATO_{i}]'
-            pattern = re.escape(dato)
-            count = len(re.findall(pattern, masked, flags=re.IGNORECASE))
-            
-            if count > 0:
-                masked = re.sub(pattern, mask, masked, flags=re.IGNORECASE)
-                reverse_mapping[mask] = dato
-                replacements.append({
-                    'campo': f'altro_{i}',
-                    'originale': dato,
-                    'mascherato': mask,
-                    'occorrenze': count
-                })
+            targets.append((f'altro_{i}', dato, f'[DATO_OSCURATO_{i}]'))
+    
+    for field, value, mask in targets:
+        # Escape regex characters in value, all occurrences (case insensitive)
+        pattern = re.compile(re.escape(value), re.IGNORECASE)
+        
+        # subn conta e sostituisce in un solo passaggio
+        count = 0
+        for idx, chunk in enumerate(chunks):
+            chunks[idx], n = pattern.subn(mask, chunk)
+            count += n
+        
+        if count > 0:
+            reverse_mapping[mask] = value
+            replacements.append({
+                'campo': field,
+                'originale': value,
+                'mascherato': mask,
+                'occorrenze': count
+            })
     
-    return masked, replacements, reverse_mapping
+    return replacements, reverse_mapping
 
 
 def repopulate_report(report_html: str, reverse_mapping: dict) -> str:
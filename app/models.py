@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, ForeignKey, Enum, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, Text, ForeignKey, Enum, Boolean, Index, text, true, false
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -18,19 +18,20 @@ class User(Base):
     email = Column(String(255), unique=True, nullable=False, index=True)  # Email as username
     username = Column(String(50), unique=True, nullable=True, index=True)  # Legacy, keep for compatibility
     password_hash = Column(String(255), nullable=False)
+    password_algo = Column(String(16), default='bcrypt')  # Selects the verifier in auth.verify_password
     
     # User management fields
-    is_admin = Column(Boolean, default=False)
-    is_active = Column(Boolean, default=True)
+    is_admin = Column(Boolean, default=False, nullable=False, server_default=false())
+    is_active = Column(Boolean, default=True, nullable=False, server_default=true())
     email_verified = Column(Boolean, default=False)  # For email verification
     access_expires_at = Column(DateTime, nullable=True)  # NULL = never expires
     last_login = Column(DateTime, nullable=True)
     
     # Token tracking (separate for cost calculation)
     # Gemini 3 Flash: $0.50/M input, $3.00/M output
-    total_input_tokens = Column(BigInteger, default=0)
-    total_output_tokens = Column(BigInteger, default=0)
-    total_tokens_used = Column(BigInteger, default=0)  # Legacy, sum of both
+    total_input_tokens = Column(BigInteger, default=0, nullable=False, server_default='0')
+    total_output_tokens = Column(BigInteger, default=0, nullable=False, server_default='0')
+    total_tokens_used = Column(BigInteger, default=0, nullable=False, server_default='0')  # Legacy, sum of both
     
     # Rate limiting for login
     login_attempts = Column(Integer, default=0)
@@ -41,8 +42,13 @@ class User(Base):
     stripe_subscription_id = Column(String(255), nullable=True)
     subscription_status = Column(String(50), nullable=True)  # active, canceled, past_due, etc.
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False, server_default=text('CURRENT_TIMESTAMP'))  # Keyset cursor of the admin user list
     documents = relationship("Document", back_populates="user")
+    
+    __table_args__ = (
+        # Keyset pagination of the admin user list (newest first)
+        Index('ix_users_created_at_id', created_at.desc(), id.desc()),
+    )
 
 class PasswordResetToken(Base):
     """Token for password reset requests"""
@@ -55,6 +61,13 @@ class PasswordResetToken(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     
     user = relationship("User")
+    
+    # Lookups only ever target unused tokens: keep that index small
+    __table_args__ = (
+        Index('ix_prt_active', 'token',
+              postgresql_where=text("used = false"),
+              sqlite_where=text("used = 0")),
+    )
 
 class Document(Base):
     __tablename__ = 'documents'
@@ -97,6 +110,11 @@ class Analysis(Base):
     show_in_dashboard = Column(Boolean, default=True) # If False, hidden from dashboard list
     last_updated = Column(DateTime, default=datetime.utcnow) # Track edits
     document = relationship("Document", back_populates="analyses")
+    
+    __table_args__ = (
+        # Cost analytics / usage rollup: status = COMPLETED over created_at ranges
+        Index('ix_analyses_status_created_at', status, created_at),
+    )
 
 
 class SystemSettings(Base):
@@ -113,6 +131,19 @@ class SystemSettings(Base):
     
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+class AnalysisUsageDaily(Base):
+    """Token usage of completed analyses per day (rollup of closed days, refreshed nightly)"""
+    __tablename__ = 'analysis_usage_daily'
+    date = Column(Date, primary_key=True)
+    input_tokens = Column(BigInteger, default=0)
+    output_tokens = Column(BigInteger, default=0)
+
+class MaintenanceRun(Base):
+    """Last run of each scheduled maintenance job (one worker process claims each night)"""
+    __tablename__ = 'maintenance_runs'
+    job = Column(String(50), primary_key=True)
+    last_run_at = Column(DateTime, nullable=True)
+
 class ProspectAnalysis(Base):
     """Stores analyses of prospect companies (OpenAPI integration)"""
     __tablename__ = 'prospect_analyses'
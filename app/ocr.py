@@ -2,7 +2,23 @@ import fitz  # PyMuPDF
 import pytesseract
 import numpy as np
 import os
+import io
+import re
+import gc
+import contextlib
+import threading
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from functools import lru_cache
+from .utils import ocr_cache
+
+# Parallelism comes from our own worker processes/threads: single-threaded
+# Tesseract avoids N workers x N OpenMP threads oversubscribing the CPU.
+# Only the Tesseract CLI gets the limit - pytesseract hands its module-level
+# `environ` to the subprocess - not this process, where it would also cap
+# torch/Doctr inference. Live view of os.environ: an explicit value wins.
+pytesseract.pytesseract.environ = ChainMap(os.environ, {'OMP_THREAD_LIMIT': '1'})
 
 # Initialize predictors (load models once if possible, or lazy load)
 # For MVP, lazy loading inside function or global init might be acceptable
@@ -11,74 +27,259 @@ from datetime import datetime
 
 DOCTR_MODEL = None
 
+# Doctr is off by default (VPS stability). OCR_USE_DOCTR=true sends all the
+# problematic pages of a hybrid PDF through batched Doctr inference.
+OCR_USE_DOCTR = os.getenv("OCR_USE_DOCTR", "false").lower() == "true"
+
+def _doctr_device() -> str:
+    """'cuda' when PyTorch sees a GPU, else 'cpu' (checked lazily, at model load)."""
+    try:
+        import torch
+        return 'cuda' if torch.cuda.is_available() else 'cpu'
+    except Exception:
+        return 'cpu'
+
+# CPU only: int8 dynamic quantization of the recognizer's LSTM/Linear layers
+# (smaller weights, faster CPU matmuls; slight accuracy trade-off, so opt-in)
+OCR_DOCTR_QUANTIZE = os.getenv("OCR_DOCTR_QUANTIZE", "false").lower() == "true"
+
+def _quantize_doctr_cpu(model):
+    """Dynamic int8 quantization of the Doctr sub-models (weights only, in place)."""
+    try:
+        import torch
+        from torch import nn
+        for predictor in (model.det_predictor, model.reco_predictor):
+            predictor.model = torch.ao.quantization.quantize_dynamic(
+                predictor.model, {nn.Linear, nn.LSTM}, dtype=torch.qint8
+            )
+        print("Doctr model quantized to int8 (dynamic)")
+    except Exception as e:
+        print(f"Warning: could not quantize Doctr model, using FP32: {e}")
+    return model
+
 def get_doctr_model():
     global DOCTR_MODEL
     if DOCTR_MODEL is None:
         try:
-            # Using cpu by default for compatibility, use cuda:True if GPU available
             from doctr.models import ocr_predictor
-            DOCTR_MODEL = ocr_predictor(det_arch='db_resnet50', reco_arch='crnn_vgg16_bn', pretrained=True)
+            model = ocr_predictor(det_arch='db_resnet50', reco_arch='crnn_vgg16_bn', pretrained=True)
+            # Detection + recognition are dense conv workloads: use the GPU when present
+            device = _doctr_device()
+            if device == 'cuda':
+                try:
+                    model.det_predictor.model.to(device)
+                    model.reco_predictor.model.to(device)
+                except Exception as e:
+                    print(f"Warning: could not move Doctr model to CUDA, using CPU: {e}")
+                    device = 'cpu'
+            # The detector processes one of our page batches per forward pass
+            pre_processor = getattr(model.det_predictor, 'pre_processor', None)
+            if pre_processor is not None:
+                pre_processor.batch_size = OCR_DOCTR_BATCH
+            if device == 'cpu' and OCR_DOCTR_QUANTIZE:
+                model = _quantize_doctr_cpu(model)
+            model._device = device
+            print(f"Doctr model loaded on {device}")
+            DOCTR_MODEL = model
         except Exception as e:
             print(f"Warning: could not load Doctr model or dependencies missing: {e}")
             return None
     return DOCTR_MODEL
 
+def release_models():
+    """Drop the cached Doctr model (~500 MB of weights) and free GPU memory."""
+    global DOCTR_MODEL
+    DOCTR_MODEL = None
+    gc.collect()
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except ImportError:
+        pass
+
+def run_doctr(model, pages):
+    """Doctr forward pass without autograd bookkeeping (FP16 autocast on CUDA)."""
+    try:
+        import torch
+    except ImportError:
+        return model(pages)
+    with torch.inference_mode():
+        if getattr(model, '_device', 'cpu') == 'cuda':
+            with torch.autocast(device_type='cuda', dtype=torch.float16):
+                return model(pages)
+        return model(pages)
+
+# "Rotate: 90" line of pytesseract's OSD output
+_OSD_ROTATE_RE = re.compile(r'Rotate:\s*(\d+)')
+
+def ocr_image_text(img) -> str:
+    """Italian OCR of a PIL image."""
+    return pytesseract.image_to_string(img, lang='ita')
+
+def detect_rotation(img) -> int:
+    """
+    OSD: clockwise rotation in degrees needed to make the image upright
+    (Tesseract's "Rotate:" line). Raises if OSD fails.
+    """
+    osd = pytesseract.image_to_osd(img)
+    # Parse rotation angle (e.g. "Rotate: 90")
+    match = _OSD_ROTATE_RE.search(osd)
+    return int(match.group(1)) if match else 0
+
+def rotate_clockwise(img, rotation: int):
+    """
+    Rotate a PIL image clockwise by `rotation` degrees (OSD / page metadata value).
+    Multiples of 90 are a pixel transpose - no resampling, no affine setup.
+    """
+    from PIL import Image
+    transpose = {
+        90: Image.Transpose.ROTATE_270,  # PIL's ROTATE_* are counter-clockwise
+        180: Image.Transpose.ROTATE_180,
+        270: Image.Transpose.ROTATE_90,
+    }.get(rotation % 360)
+    if transpose is not None:
+        return img.transpose(transpose)
+    if rotation % 360 == 0:
+        return img
+    return img.rotate(-rotation, expand=True)
+
+# Zoom used to rasterize pages for OCR (2.0 = ~144 DPI): scans and any page
+# that may carry scanned content
+OCR_RENDER_ZOOM = float(os.getenv("OCR_RENDER_ZOOM", "2.0"))
+# Born-digital pages (native text, no embedded image) hold vector text only:
+# 1.5 = ~108 DPI is enough there, and 44% fewer pixels to render and OCR
+OCR_TEXT_PAGE_ZOOM = float(os.getenv("OCR_TEXT_PAGE_ZOOM", "1.5"))
+MIN_NATIVE_WORDS_FOR_LOW_ZOOM = 5
+
+def pick_ocr_zoom(wc: int, rotation: int, has_images: bool = True) -> float:
+    """
+    Render zoom for one page: upright born-digital pages (some native text,
+    no embedded image) get OCR_TEXT_PAGE_ZOOM; pixel count - and so render +
+    OCR time - grows with zoom squared, so OCR_RENDER_ZOOM is kept for pages
+    that may be scans. has_images unknown: assume a scan.
+    """
+    if wc >= MIN_NATIVE_WORDS_FOR_LOW_ZOOM and rotation == 0 and not has_images:
+        return OCR_TEXT_PAGE_ZOOM
+    return OCR_RENDER_ZOOM
+
+def render_page_image(page, zoom: float = OCR_RENDER_ZOOM):
+    """Rasterize a PDF page to a grayscale PIL image for Tesseract (single place for OCR rendering)."""
+    from PIL import Image
+    # Tesseract binarizes a gray image anyway: rendering 1 channel instead of
+    # RGB is a third of the pixels to render, hand over and preprocess
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    # frombuffer wraps the samples bytes instead of copying them again (read-only image)
+    return Image.frombuffer("L", (pix.width, pix.height), pix.samples, "raw", "L", 0, 1)
+
+def _file_cache_key(file_path: str) -> tuple:
+    """Identity of a file on disk: a rewritten file never hits a stale cache entry."""
+    st = os.stat(file_path)
+    return (os.path.abspath(file_path), st.st_mtime_ns, st.st_size)
+
+def _open_pdf(file_path: str, doc=None):
+    """
+    Context manager for a PDF: the caller's already-open document (left open
+    on exit) or a freshly opened one - lets one parse serve every OCR step.
+    """
+    return contextlib.nullcontext(doc) if doc is not None else fitz.open(file_path)
+
 def extract_native_text(file_path: str) -> str:
     """Extract text from PDF using PyMuPDF (native)."""
-    text = ""
+    parts = []
     try:
         with fitz.open(file_path) as doc:
             for page in doc:
-                text += page.get_text()
+                parts.append(page.get_text())
     except Exception as e:
         print(f"Error in extract_native_text: {e}")
-    return text
+    return "".join(parts)
+
+# OCR_CONCURRENCY=N: concurrent Tesseract calls per server worker process
+# (shared thread pool below; per document with the process pool); 0 = 2.
+# Size it with the uvicorn worker count: workers x N ~ CPU cores.
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "0"))
+
+# Tesseract releases the GIL while recognizing: OCR runs on a thread pool,
+# while MuPDF calls (not thread-safe) stay on the calling thread.
+# One pool per process, shared by every OCR job: concurrent jobs queue for the
+# same threads instead of each starting its own (jobs x threads x workers).
+OCR_THREADS = OCR_CONCURRENCY if OCR_CONCURRENCY > 0 else 2
+OCR_EXECUTOR = ThreadPoolExecutor(max_workers=OCR_THREADS, thread_name_prefix="ocr")
+# Producer/consumer pipeline: the calling thread renders (producer) while the
+# pool OCRs (consumers). At most OCR_PREFETCH_PAGES rendered pages wait for a
+# free consumer (~3 MB each at 144 DPI grayscale), so memory stays bounded.
+OCR_PREFETCH_PAGES = 2
+
+def _pipeline_slots(workers: int = OCR_THREADS):
+    """In-flight budget for one pipeline: pages being OCR'd + prefetched ones."""
+    return threading.BoundedSemaphore(workers + OCR_PREFETCH_PAGES)
+
+def _submit_bounded(executor, slots, fn, *args):
+    """Hand work to the consumers; blocks the producer while the queue is full."""
+    slots.acquire()
+    future = executor.submit(fn, *args)
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+# Below this many native words a page with no scanned image is near-blank:
+# OSD needs text to work with and mostly fails there anyway
+MIN_WORDS_FOR_OSD = 5
+
+def full_page_needs_osd(wc: int, rotation: int, has_images: bool) -> bool:
+    """
+    OSD before full-page OCR: only for pages with no rotation metadata (a
+    rotation in the metadata is trusted as is), and not on near-blank pages
+    that have no embedded image to carry the text. A readable native text
+    layer (header, DMS footer) says nothing about how the scan is oriented.
+    """
+    if rotation != 0:
+        return False
+    return wc >= MIN_WORDS_FOR_OSD or has_images
+
+def ocr_full_page(img, run_osd: bool = True, label: str = "") -> str:
+    """OSD rotation correction (optional) + Tesseract OCR of a rendered page."""
+    if run_osd:
+        # OSD Rotation Detection (expensive, only if needed)
+        try:
+            rotation = detect_rotation(img)
+            if rotation != 0:
+                print(f"  {label}OSD detected rotation {rotation}°, correcting...")
+                img = rotate_clockwise(img, rotation)
+        except Exception as e:
+            # OSD can fail on pages with little text
+            print(f"  {label}OSD failed, skipping rotation: {e}")
+    return ocr_image_text(img)
 
-def extract_with_tesseract(file_path: str) -> str:
-    """Fallback OCR using Tesseract with rotation correction."""
+def extract_with_tesseract(file_path: str, page_data: list = None, doc=None) -> str:
+    """
+    Fallback OCR using Tesseract with rotation correction.
+    page_data (from analyze_pdf), when known, lets pages with rotation metadata skip OSD.
+    """
     text = ""
     try:
-        with fitz.open(file_path) as doc:
-            for page in doc:
+        with _open_pdf(file_path, doc) as pdf:
+            slots = _pipeline_slots()
+            futures = []
+            for page_num, page in enumerate(pdf):
+                run_osd = True
+                zoom = OCR_RENDER_ZOOM
+                if page_data and page_num < len(page_data):
+                    wc, _, rotation, _ = page_data[page_num]
+                    run_osd = rotation == 0
+                    zoom = pick_ocr_zoom(wc, rotation, bool(page.get_images()))
                 # Render at optimal resolution (2x zoom = ~144 DPI) - sufficient for Italian OCR
-                mat = fitz.Matrix(2.0, 2.0)
-                pix = page.get_pixmap(matrix=mat)
-                mode = "RGB" if pix.alpha == 0 else "RGBA"
-                img_data = pix.samples
-                from PIL import Image
-                img = Image.frombytes(mode, [pix.width, pix.height], img_data)
-                
-                # OSD Rotation Detection (expensive, only if needed)
-                try:
-                    osd = pytesseract.image_to_osd(img)
-                    # Parse rotation angle (e.g. "Rotate: 90")
-                    rotation = 0
-                    for line in osd.split("\n"):
-                        if "Rotate:" in line:
-                            rotation = int(line.split(":")[1].strip())
-                            break
-                    
-                    if rotation != 0:
-                        # print(f"Detected rotation: {rotation}")
-                        img = img.rotate(-rotation, expand=True)
-                except Exception as e:
-                    # OSD can fail on pages with little text
-                    print(f"OSD failed, skipping rotation: {e}")
-
-                # Tesseract OCR
-                page_text = pytesseract.image_to_string(img, lang='ita')
-                text += page_text + "\n"
+                # (page N+1 renders while page N is in Tesseract)
+                img = render_page_image(page, zoom)
+                futures.append(_submit_bounded(OCR_EXECUTOR, slots, ocr_full_page, img, run_osd))
+            # Tesseract OCR results, in page order
+            text = "".join(future.result() + "\n" for future in futures)
     except Exception as e:
         print(f"Error in extract_with_tesseract: {e}")
     return text
 
 def extract_with_doctr(file_path: str) -> str:
     """OCR using Doctr (Converting PDF to images first for consistency)."""
-    try:
-        from doctr.io import DocumentFile
-    except (ImportError, OSError) as e:
-        raise RuntimeError(f"Doctr dependencies missing: {e}")
-
     model = get_doctr_model()
     if not model:
         raise RuntimeError("Doctr model not available")
@@ -86,45 +287,133 @@ def extract_with_doctr(file_path: str) -> str:
     # Manually render PDF pages to images using PyMuPDF
     # This ensures we get high-resolution input (same as Tesseract fix)
     # and bypass potential system dependency issues with DocumentFile.from_pdf
-    page_images = []
     try:
         with fitz.open(file_path) as doc:
-            for page in doc:
-                # 2.0 zoom = ~144 DPI (optimal balance for Speed/Accuracy on Italian text)
-                mat = fitz.Matrix(2.0, 2.0) 
-                pix = page.get_pixmap(matrix=mat)
-                
-                # Convert to numpy array for Doctr
-                # pix.samples is bytes, we need to shape it (h, w, 3)
-                img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape((pix.height, pix.width, pix.n))
-                
-                # Doctr expects RGB. If RGBA (n=4), drop alpha
-                if pix.n == 4:
-                    img_array = img_array[..., :3]
-                
-                page_images.append(img_array)
+            texts = dict(_doctr_ocr_batched(model, doc, range(len(doc))))
     except Exception as e:
-        print(f"Error rendering PDF for Doctr: {e}")
-        # If rendering fails, we can't do Doctr this way.
+        print(f"Error in Doctr OCR: {e}")
         raise e
+    
+    return "".join(texts[page_num] for page_num in sorted(texts))
 
-    if not page_images:
-        return ""
+def _doctr_page_text(page) -> str:
+    """Flatten one Doctr result page to text (one line per detected line)."""
+    # One join per line + one per page instead of O(n^2) string concatenation
+    return "".join(
+        "".join(word.value + " " for word in line.words) + "\n"
+        for block in page.blocks
+        for line in block.lines
+    )
 
-    # Pass list of numpy arrays to Doctr
-    doc = DocumentFile.from_images(page_images)
-    result = model(doc)
-    text = ""
-    for page in result.pages:
-        for block in page.blocks:
-            for line in block.lines:
-                for word in line.words:
-                    text += word.value + " "
-                text += "\n"
-    return text
+def render_page_array(page, zoom: float = OCR_RENDER_ZOOM) -> tuple:
+    """
+    Rasterize a PDF page to an (h, w, 3) uint8 RGB array for Doctr.
+    Returns (array, pixmap): the array is a zero-copy view on the pixmap's
+    samples, so the caller must keep the pixmap referenced while using it.
+    """
+    # alpha=False: MuPDF writes 3 channels, no alpha plane to allocate or slice off
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    img_array = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape((pix.height, pix.width, 3))
+    return img_array, pix
+
+# Pages per Doctr forward pass: rendered pages are ~8 MB each at 144 DPI RGB,
+# so the whole document is never resident at once
+OCR_DOCTR_BATCH = max(1, int(os.getenv("OCR_DOCTR_BATCH", "4")))
+
+def _render_doctr_batch(doc, batch: list) -> tuple:
+    """Render a batch of pages: (arrays, pixmaps) - the arrays are views on the pixmaps."""
+    page_images = []
+    pixmaps = []
+    for page_num in batch:
+        # 2.0 zoom = ~144 DPI (optimal balance for Speed/Accuracy on Italian text)
+        img_array, pix = render_page_array(doc[page_num])
+        page_images.append(img_array)
+        pixmaps.append(pix)
+    return page_images, pixmaps
+
+def _doctr_infer_texts(model, page_images: list) -> list:
+    """Doctr inference on a rendered batch -> text per page (runs on the inference thread)."""
+    # The predictor takes a list of HxWx3 arrays
+    result = run_doctr(model, page_images)
+    return [_doctr_page_text(page) for page in result.pages]
+
+def _doctr_ocr_batched(model, doc, page_nums):
+    """
+    Yield (page_num, text) for the given pages of an open document, running
+    Doctr on OCR_DOCTR_BATCH pages at a time. Each batch's pixmaps are
+    released once its inference is done.
+    
+    MuPDF is not thread-safe, so pages are rendered on this thread only; the
+    model (which releases the GIL) runs on a helper thread, so batch N+1 is
+    rendered while batch N is being inferred (at most two batches resident).
+    """
+    page_nums = list(page_nums)
+    batches = [page_nums[i:i + OCR_DOCTR_BATCH] for i in range(0, len(page_nums), OCR_DOCTR_BATCH)]
+    if not batches:
+        return
+    
+    with ThreadPoolExecutor(max_workers=1) as inference:
+        rendered = _render_doctr_batch(doc, batches[0])
+        for index, batch in enumerate(batches):
+            page_images, pixmaps = rendered
+            future = inference.submit(_doctr_infer_texts, model, page_images)
+            # Render the next batch while the model works on this one
+            rendered = _render_doctr_batch(doc, batches[index + 1]) if index + 1 < len(batches) else None
+            texts = future.result()
+            
+            # Drop the views before their pixmaps so MuPDF frees the buffers now
+            del page_images[:], pixmaps[:]
+            yield from zip(batch, texts)
+
+def ocr_pages_with_doctr(file_path: str, page_nums: list, doc=None) -> dict:
+    """
+    OCR the given pages with batched Doctr inference (OCR_DOCTR_BATCH pages per pass).
+    Returns {page_num: text}. Raises RuntimeError if Doctr is unavailable.
+    """
+    model = get_doctr_model()
+    if not model:
+        raise RuntimeError("Doctr model not available")
+    
+    with _open_pdf(file_path, doc) as pdf:
+        return dict(_doctr_ocr_batched(model, pdf, sorted(page_nums)))
+
+def process_pdf_doctr_batch(file_path: str, page_data: list, pages_needing_ocr: list, doc=None) -> str:
+    """Hybrid OCR with Doctr: native text where fine, batched inference for the rest."""
+    print(f"🧠 DOCTR BATCH OCR: {len(pages_needing_ocr)} pages, {OCR_DOCTR_BATCH} per inference")
+    doctr_texts = ocr_pages_with_doctr(file_path, pages_needing_ocr, doc)
+    
+    combined_text = []
+    for page_num, (wc, native_text, _, _) in enumerate(page_data):
+        ocr_text = doctr_texts.get(page_num)
+        # Same rule as the Tesseract full-page OCR: keep OCR only if it improves
+        if ocr_text is not None and (has_more_words(ocr_text, wc) or is_text_quality_good(ocr_text)):
+            combined_text.append(ocr_text)
+        else:
+            combined_text.append(native_text)
+    return "\n".join(combined_text)
+
+# Same word boundaries as str.split()
+_WORD_RE = re.compile(r'\S+')
 
 def word_count(text: str) -> int:
-    return len(text.split())
+    # Walks the matches instead of building the list of every word
+    return sum(1 for _ in _WORD_RE.finditer(text))
+
+def has_more_words(text: str, n: int) -> bool:
+    """word_count(text) > n, but stops scanning at the (n+1)-th word."""
+    for count, _ in enumerate(_WORD_RE.finditer(text), 1):
+        if count > n:
+            return True
+    return False
+
+# Lookup tables over the Basic Multilingual Plane, indexed by code point:
+# the quality check becomes a few NumPy reductions instead of per-char Python loops
+# (code points above the BMP are rare and checked one by one)
+_BMP_SIZE = 0x10000
+_ALNUM_LUT = np.fromiter((chr(i).isalnum() for i in range(_BMP_SIZE)), dtype=bool, count=_BMP_SIZE)
+_UNUSUAL_CHARS = "°''""«»§←→↑↓∈∉∪∩"
+_UNUSUAL_LUT = np.zeros(_BMP_SIZE, dtype=bool)
+_UNUSUAL_LUT[[ord(c) for c in _UNUSUAL_CHARS]] = True
 
 def is_text_quality_good(text: str) -> bool:
     """
@@ -134,9 +423,17 @@ def is_text_quality_good(text: str) -> bool:
     if not text or len(text.strip()) < 20:
         return False
     
+    # One code point per element (UTF-32), no per-character Python dispatch
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    in_bmp = codes < _BMP_SIZE
+    bmp_codes = np.where(in_bmp, codes, 0)
+    
     # Count alphanumeric vs special characters
-    alnum_count = sum(1 for c in text if c.isalnum())
-    total_chars = len(text.replace(" ", "").replace("\n", ""))
+    alnum_count = int(np.count_nonzero(_ALNUM_LUT[bmp_codes] & in_bmp))
+    if not in_bmp.all():
+        # The few code points past the tables (math letters/digits, emoji): str.isalnum
+        alnum_count += sum(1 for code in codes[~in_bmp].tolist() if chr(code).isalnum())
+    total_chars = int(np.count_nonzero((codes != 0x20) & (codes != 0x0A)))
     
     if total_chars == 0:
         return False
@@ -153,90 +450,102 @@ def is_text_quality_good(text: str) -> bool:
     words = text.split()
     if len(words) > 10:
         # Check if most "words" are very short (1-2 chars) - sign of garbled text
-        short_words = sum(1 for w in words if len(w) <= 2)
-        short_ratio = short_words / len(words)
+        word_lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        short_ratio = np.count_nonzero(word_lengths <= 2) / len(words)
         if short_ratio > 0.5:
             print(f"  Text quality check: too many short words {short_ratio:.2f}")
             return False
         
         # Check for repeated unusual patterns
-        unusual_chars = sum(1 for c in text if c in "°''""«»§←→↑↓∈∉∪∩")
+        unusual_chars = int(np.count_nonzero(_UNUSUAL_LUT[bmp_codes] & in_bmp))
         if unusual_chars > len(text) * 0.05:
             print(f"  Text quality check: too many unusual chars")
             return False
     
     return True
 
-def get_page_word_counts(file_path: str) -> list[tuple[int, str, int, bool]]:
+@lru_cache(maxsize=32)
+def _analyze_pdf_cached(cache_key: tuple) -> tuple:
+    file_path = cache_key[0]
+    page_data = []
+    with fitz.open(file_path) as doc:
+        for page_num, page in enumerate(doc):
+            text = page.get_text()
+            rotation = page.rotation  # 0, 90, 180, or 270
+            quality_good = is_text_quality_good(text)
+            
+            if rotation != 0:
+                print(f"  Page {page_num + 1}: Detected rotation metadata: {rotation}°")
+            if not quality_good:
+                print(f"  Page {page_num + 1}: Text quality check FAILED - will use OCR")
+            
+            page_data.append((word_count(text), text, rotation, quality_good))
+    return tuple(page_data)
+
+def analyze_pdf(file_path: str) -> list[tuple[int, str, int, bool]]:
     """
-    Returns list of (word_count, text, rotation, is_quality_good) for each page.
+    Single pass over the PDF: returns (word_count, text, rotation, is_quality_good) per page.
     rotation: page rotation in degrees (0, 90, 180, 270)
     is_quality_good: True if text appears readable, False if likely garbled
+    
+    Results are cached per (path, mtime, size), so repeated calls on the same
+    file don't re-extract it.
     """
-    page_data = []
     try:
-        with fitz.open(file_path) as doc:
-            for page_num, page in enumerate(doc):
-                text = page.get_text()
-                rotation = page.rotation  # 0, 90, 180, or 270
-                quality_good = is_text_quality_good(text)
-                
-                if rotation != 0:
-                    print(f"  Page {page_num + 1}: Detected rotation metadata: {rotation}°")
-                if not quality_good:
-                    print(f"  Page {page_num + 1}: Text quality check FAILED - will use OCR")
-                
-                page_data.append((word_count(text), text, rotation, quality_good))
+        return list(_analyze_pdf_cached(_file_cache_key(file_path)))
     except Exception as e:
         print(f"Error getting page word counts: {e}")
-    return page_data
+        return []
 
-def extract_images_from_page_ocr(page, page_num: int) -> str:
-    """Extract images from a page and run OCR on them using Tesseract."""
-    from PIL import Image
-    text_parts = []
+# Backward-compatible name
+get_page_word_counts = analyze_pdf
+
+# Embedded images smaller than this (px, either side) are decorative: not OCR'd
+MIN_EMBEDDED_IMAGE_SIDE = 500
+# ...and so are images drawn over less than this fraction of the page area
+# (a high-resolution logo scaled down to a corner is not content)
+MIN_EMBEDDED_IMAGE_PAGE_FRACTION = 0.05
+
+def extract_page_images(page, page_num: int) -> list:
+    """
+    Extract the large embedded images of a page as (xref, RGB PIL image) pairs
+    (MuPDF side, calling thread).
+    """
+    pil_images = []
     
     try:
-        images = page.get_images()
-        for img_index, img in enumerate(images):
-            xref = img[0]
-            # Get image dimensions - skip small images (logos, icons)
-            width = img[2]
-            height = img[3]
-            if width < 500 or height < 500:
+        # Only images actually drawn on this page, with their placement: skip
+        # small images (logos, icons) - by pixels and by size on the page - from
+        # the listing alone, before decoding anything
+        page_area = abs(page.rect) or 1.0
+        images = []
+        seen_xrefs = set()
+        for img_index, info in enumerate(page.get_image_info(xrefs=True)):
+            xref = info.get("xref", 0)
+            if xref == 0 or xref in seen_xrefs:  # 0 = inline image (not extractable)
                 continue
-                
+            if info["width"] < MIN_EMBEDDED_IMAGE_SIDE or info["height"] < MIN_EMBEDDED_IMAGE_SIDE:
+                continue
+            if abs(fitz.Rect(info["bbox"])) < page_area * MIN_EMBEDDED_IMAGE_PAGE_FRACTION:
+                continue
+            seen_xrefs.add(xref)
+            images.append((img_index, xref))
+        if not images:
+            return pil_images
+        
+        from PIL import Image
+        for img_index, xref in images:
             try:
                 base_image = page.parent.extract_image(xref)
                 image_bytes = base_image["image"]
                 
                 # Convert to PIL Image
-                import io
                 pil_image = Image.open(io.BytesIO(image_bytes))
                 
                 # Convert to RGB if needed
                 if pil_image.mode != 'RGB':
                     pil_image = pil_image.convert('RGB')
-                
-                # OSD Rotation Detection for embedded images (expensive, only if needed)
-                try:
-                    osd = pytesseract.image_to_osd(pil_image)
-                    rotation = 0
-                    for line in osd.split("\n"):
-                        if "Rotate:" in line:
-                            rotation = int(line.split(":")[1].strip())
-                            break
-                    if rotation != 0:
-                        print(f"  Image {img_index} on page {page_num}: Detected rotation {rotation}°, correcting...")
-                        pil_image = pil_image.rotate(-rotation, expand=True)
-                except Exception as e:
-                    # OSD can fail on images with little text
-                    pass
-                
-                # Run Tesseract OCR on the image
-                ocr_text = pytesseract.image_to_string(pil_image, lang='ita')
-                if ocr_text.strip():
-                    text_parts.append(ocr_text)
+                pil_images.append((xref, pil_image))
                     
             except Exception as e:
                 print(f"Error extracting image {img_index} from page {page_num}: {e}")
@@ -245,92 +554,84 @@ def extract_images_from_page_ocr(page, page_num: int) -> str:
     except Exception as e:
         print(f"Error processing images on page {page_num}: {e}")
     
-    return "\n".join(text_parts)
-
-# ============================================================================
-# PHASE 2A: PARALLEL OCR IMPLEMENTATION (2 Workers)
-# ============================================================================
+    return pil_images
 
-def process_single_page(args: tuple) -> tuple:
+def ocr_page_images(pil_images: list, page_num: int,
+                    osd_cache: dict = None, text_cache: dict = None) -> str:
     """
-    Worker function for parallel processing of a single PDF page.
-    This function is called by ProcessPoolExecutor for each page.
-    
-    Args:
-        args: (file_path, page_num, wc, native_text, rotation, quality_good, pages_needing_ocr)
-    
-    Returns:
-        (page_num, extracted_text)
+    Run OSD + Tesseract OCR on a page's embedded images (thread-safe).
+    pil_images: (xref, image) pairs from extract_page_images.
+    osd_cache / text_cache: xref -> rotation / OCR text, shared across the pages
+    of one document so an image repeated on many pages (letterhead scan,
+    stamp, watermark) gets OSD and OCR only once.
     """
-    file_path, page_num, wc, native_text, rotation, quality_good, pages_needing_ocr = args
-    
-    # If page doesn't need OCR, return native text immediately
-    if page_num not in pages_needing_ocr:
-        return (page_num, native_text)
-    
-    try:
-        import fitz
-        from PIL import Image
-        import pytesseract
-        
-        with fitz.open(file_path) as doc:
-            page = doc[page_num]
-            
-            # Try OCR on embedded images first
-            ocr_text = extract_images_from_page_ocr(page, page_num)
-            
-            if word_count(ocr_text) > wc and is_text_quality_good(ocr_text):
-                print(f"  [Worker] Page {page_num + 1}: Embedded image OCR extracted {word_count(ocr_text)} words")
-                return (page_num, ocr_text)
-            
-            # Fallback: full page render + OCR
-            mat = fitz.Matrix(2.0, 2.0)  # 2x zoom (144 DPI)
-            pix = page.get_pixmap(matrix=mat)
-            mode = "RGB" if pix.alpha == 0 else "RGBA"
-            img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
-            
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # OSD only if rotation metadata is 0 (unknown)
-            if rotation == 0:
+    if osd_cache is None:
+        osd_cache = {}
+    if text_cache is None:
+        text_cache = {}
+    text_parts = []
+    for img_index, (xref, pil_image) in enumerate(pil_images):
+        cached_text = text_cache.get(xref)
+        if cached_text is not None:
+            if cached_text.strip():
+                text_parts.append(cached_text)
+            continue
+        try:
+            # OSD Rotation Detection for embedded images (once per xref): the
+            # page's native text layer doesn't tell how a scan is oriented
+            rotation = osd_cache.get(xref)
+            if rotation is None:
                 try:
-                    osd = pytesseract.image_to_osd(img)
-                    for line in osd.split("\n"):
-                        if "Rotate:" in line:
-                            detected_rotation = int(line.split(":")[1].strip())
-                            if detected_rotation != 0:
-                                img = img.rotate(-detected_rotation, expand=True)
-                                print(f"  [Worker] Page {page_num + 1}: OSD detected rotation {detected_rotation}°")
-                            break
-                except:
-                    pass  # OSD failed, continue without rotation
-            elif rotation != 0:
-                img = img.rotate(-rotation, expand=True)
-            
-            full_page_ocr = pytesseract.image_to_string(img, lang='ita')
+                    rotation = detect_rotation(pil_image)
+                except Exception as e:
+                    # OSD can fail on images with little text: don't retry it on the next page
+                    rotation = 0
+                osd_cache[xref] = rotation
+            if rotation != 0:
+                print(f"  Image {img_index} on page {page_num}: Detected rotation {rotation}°, correcting...")
+                pil_image = rotate_clockwise(pil_image, rotation)
             
-            if word_count(full_page_ocr) > wc or is_text_quality_good(full_page_ocr):
-                print(f"  [Worker] Page {page_num + 1}: Full-page OCR extracted {word_count(full_page_ocr)} words")
-                return (page_num, full_page_ocr)
-            else:
-                print(f"  [Worker] Page {page_num + 1}: Kept native text ({wc} words)")
-                return (page_num, native_text)
-                
-    except Exception as e:
-        print(f"ERROR [Worker] Page {page_num + 1}: {e}")
-        return (page_num, native_text)  # Fallback to native on error
+            # Run Tesseract OCR on the image
+            ocr_text = ocr_image_text(pil_image)
+            text_cache[xref] = ocr_text
+            if ocr_text.strip():
+                text_parts.append(ocr_text)
+        except Exception as e:
+            print(f"Error in OCR of image {img_index} from page {page_num}: {e}")
+    
+    return "\n".join(text_parts)
+
+def extract_images_from_page_ocr(page, page_num: int) -> str:
+    """Extract images from a page and run OCR on them using Tesseract."""
+    return ocr_page_images(extract_page_images(page, page_num), page_num)
+
+# ============================================================================
+# PHASE 2A: PARALLEL OCR IMPLEMENTATION (workers scaled to CPU/RAM)
+# ============================================================================
+
+# Worker processes are opt-in (OCR_USE_PROCESS_POOL=true): the thread pool
+# gets the same per-page parallelism - Tesseract runs outside the GIL - with
+# no interpreter spawn + imports per worker, and works the same on Windows.
+OCR_USE_PROCESS_POOL = os.getenv("OCR_USE_PROCESS_POOL", "false").lower() == "true"
+# Without OCR_CONCURRENCY: OCR_THREADS, fewer for few pages or little free RAM (~1.5 GB per worker)
+OCR_WORKER_RAM_GB = 1.5
 
+def ocr_worker_count(pages_to_ocr: int, available_gb: float) -> int:
+    """Number of OCR worker processes for one document."""
+    if OCR_CONCURRENCY > 0:
+        return OCR_CONCURRENCY
+    return max(1, min(OCR_THREADS, pages_to_ocr, int(available_gb // OCR_WORKER_RAM_GB)))
 
-def process_pdf_parallel(file_path: str, page_data: list, pages_needing_ocr: set, num_pages: int) -> str:
+def process_pdf_parallel(file_path: str, page_data: list, pages_needing_ocr: set, num_pages: int, doc=None) -> str:
     """
-    Process PDF with parallel OCR using max 2 workers (Phase 2A).
+    Process PDF with parallel OCR, one worker per core within the RAM budget (Phase 2A).
     
     Args:
         file_path: Path to PDF
         page_data: List of (wc, native_text, rotation, quality_good) for each page
         pages_needing_ocr: Set of page numbers that need OCR
         num_pages: Total pages
+        doc: Already-open fitz document for file_path (optional)
     
     Returns:
         Combined text from all pages
@@ -345,32 +646,28 @@ def process_pdf_parallel(file_path: str, page_data: list, pages_needing_ocr: set
         
         if available_gb < 2.0:
             print(f"⚠️ WARNING: Low RAM ({available_gb:.2f}GB < 2GB), falling back to sequential OCR")
-            return process_pdf_sequential(file_path, page_data, pages_needing_ocr, num_pages)
+            return process_pdf_sequential(file_path, page_data, pages_needing_ocr, num_pages, doc)
     except Exception as e:
         print(f"⚠️ WARNING: Could not check RAM ({e}), falling back to sequential OCR")
-        return process_pdf_sequential(file_path, page_data, pages_needing_ocr, num_pages)
+        return process_pdf_sequential(file_path, page_data, pages_needing_ocr, num_pages, doc)
     
     # Safety check #2: Only use parallel for files with >= 10 pages
     if num_pages < 10:
         print(f"ℹ️ INFO: File has only {num_pages} pages, using sequential OCR")
-        return process_pdf_sequential(file_path, page_data, pages_needing_ocr, num_pages)
+        return process_pdf_sequential(file_path, page_data, pages_needing_ocr, num_pages, doc)
     
-    print(f"🚀 PARALLEL OCR (2 workers): {num_pages} pages, {len(pages_needing_ocr)} need OCR | RAM: {available_gb:.2f}GB")
+    workers = ocr_worker_count(len(pages_needing_ocr), available_gb)
+    print(f"🚀 PARALLEL OCR ({workers} workers): {num_pages} pages, {len(pages_needing_ocr)} need OCR | RAM: {available_gb:.2f}GB")
     
-    # Prepare arguments for workers
-    worker_args = [
-        (file_path, page_num, wc, native_text, rotation, quality_good, pages_needing_ocr)
-        for page_num, (wc, native_text, rotation, quality_good) in enumerate(page_data)
-    ]
-    
-    # Process in parallel with max 2 workers
+    # Same render/OCR pipeline as the threaded path: pages are rendered and
+    # their images decoded once, here, and only pixels are shipped to the
+    # workers (no PDF re-open/re-parse per page in each worker)
+    combined_text = [native_text for _, native_text, _, _ in page_data]
     try:
-        with ProcessPoolExecutor(max_workers=2) as executor:
-            results = list(executor.map(process_single_page, worker_args))
-        
-        # Sort by page number and extract text
-        results.sort(key=lambda x: x[0])
-        combined_text = [text for _, text in results]
+        with _open_pdf(file_path, doc) as pdf, \
+                ProcessPoolExecutor(max_workers=workers) as executor:
+            _hybrid_ocr_pipeline(pdf, executor, _pipeline_slots(workers), page_data,
+                                 sorted(pages_needing_ocr), combined_text)
         
         print(f"✅ PARALLEL OCR completed successfully")
         return "\n".join(combined_text)
@@ -378,7 +675,7 @@ def process_pdf_parallel(file_path: str, page_data: list, pages_needing_ocr: set
     except Exception as e:
         print(f"❌ ERROR: Parallel processing failed: {e}")
         print("FALLBACK: Using sequential OCR")
-        return process_pdf_sequential(file_path, page_data, pages_needing_ocr, num_pages)
+        return process_pdf_sequential(file_path, page_data, pages_needing_ocr, num_pages, doc)
 
 
 
@@ -388,71 +685,82 @@ def append_debug_log(msg: str):
     with open("ocr_debug.log", "a", encoding="utf-8") as f:
         f.write(f"[{timestamp}] {msg}\n")
 
-def process_pdf_sequential(file_path: str, page_data: list, pages_needing_ocr: set, num_pages: int) -> str:
+def _hybrid_ocr_pipeline(doc, executor, slots, page_data: list, ocr_pages: list, combined_text: list):
+    """
+    OCR the given pages of an open document into combined_text (page-indexed,
+    pre-filled with the native text). MuPDF work happens on this thread; the
+    OCR calls go to the executor (thread or process pool) - only picklable
+    PIL images cross it.
+    """
+    # 1. Page needs OCR - try embedded images first
+    embedded_futures = {}
+    has_images = {}
+    # Per-xref results, shared by the pool threads (a process pool pickles a copy per task: no reuse there)
+    osd_cache = {}
+    text_cache = {}
+    for page_num in ocr_pages:
+        append_debug_log(f"Process Page {page_num+1} - Start OCR")
+        images = extract_page_images(doc[page_num], page_num)
+        has_images[page_num] = bool(images)
+        embedded_futures[page_num] = _submit_bounded(
+            executor, slots, ocr_page_images, images, page_num, osd_cache, text_cache
+        )
+    
+    # 2. Full page render + OCR where embedded images weren't enough
+    #    (in completion order: a slow page doesn't hold back the others' fallback)
+    page_of = {future: page_num for page_num, future in embedded_futures.items()}
+    full_page_futures = {}
+    for embedded_future in as_completed(page_of):
+        page_num = page_of[embedded_future]
+        wc, _, rotation, _ = page_data[page_num]
+        ocr_text = embedded_future.result()
+        
+        if has_more_words(ocr_text, wc) and is_text_quality_good(ocr_text):
+            combined_text[page_num] = ocr_text
+            n_words = word_count(ocr_text)
+            print(f"  Page {page_num + 1}: Embedded image OCR extracted {n_words} words")
+            append_debug_log(f"Process Page {page_num+1} - Embedded Image OCR Success ({n_words} words)")
+            continue
+        
+        img = render_page_image(doc[page_num], pick_ocr_zoom(wc, rotation, has_images[page_num]))
+        append_debug_log(f"Process Page {page_num+1} - Full Page Tesseract Start")
+        # OSD rotation detection (only if metadata rotation is 0)
+        run_osd = full_page_needs_osd(wc, rotation, has_images[page_num])
+        full_page_futures[page_num] = _submit_bounded(
+            executor, slots, ocr_full_page, img, run_osd, f"Page {page_num + 1}: "
+        )
+    
+    # 3. Keep full-page OCR only where it beats the native text
+    page_of = {future: page_num for page_num, future in full_page_futures.items()}
+    for future in as_completed(page_of):
+        page_num = page_of[future]
+        wc = page_data[page_num][0]
+        full_page_ocr = future.result()
+        append_debug_log(f"Process Page {page_num+1} - Full Page Tesseract End")
+        
+        if has_more_words(full_page_ocr, wc) or is_text_quality_good(full_page_ocr):
+            combined_text[page_num] = full_page_ocr
+            print(f"  Page {page_num + 1}: Full-page OCR extracted {word_count(full_page_ocr)} words")
+        else:
+            print(f"  Page {page_num + 1}: Kept native text ({wc} words) - OCR didn't improve")
+
+def process_pdf_sequential(file_path: str, page_data: list, pages_needing_ocr: set, num_pages: int, doc=None) -> str:
     """
-    Sequential OCR processing (original implementation).
-    This is a fallback when parallel is not safe/beneficial.
+    In-process OCR (no worker processes): the fallback when the process pool is
+    not safe/beneficial. MuPDF work stays on this thread, Tesseract runs on a
+    thread pool.
     """
     msg = f"📄 SEQUENTIAL OCR STARTED: {num_pages} pages, {len(pages_needing_ocr)} need OCR"
     print(msg)
     append_debug_log(msg)
     
-    combined_text = []
+    # Use native text for every page that doesn't need OCR
+    combined_text = [native_text for _, native_text, _, _ in page_data]
+    ocr_pages = sorted(pages_needing_ocr)
     
     try:
-        with fitz.open(file_path) as doc:
-            for page_num, (wc, native_text, rotation, quality_good) in enumerate(page_data):
-                # Use native text if page doesn't need OCR
-                if page_num not in pages_needing_ocr:
-                    combined_text.append(native_text)
-                    continue
-                
-                # Page needs OCR - existing hybrid logic
-                append_debug_log(f"Process Page {page_num+1} - Start OCR")
-                page = doc[page_num]
-                
-                # Try embedded images first
-                ocr_text = extract_images_from_page_ocr(page, page_num)
-                
-                if word_count(ocr_text) > wc and is_text_quality_good(ocr_text):
-                    combined_text.append(ocr_text)
-                    print(f"  Page {page_num + 1}: Embedded image OCR extracted {word_count(ocr_text)} words")
-                    append_debug_log(f"Process Page {page_num+1} - Embedded Image OCR Success ({word_count(ocr_text)} words)")
-                else:
-                    # Full page render + OCR
-                    mat = fitz.Matrix(2.0, 2.0)
-                    pix = page.get_pixmap(matrix=mat)
-                    from PIL import Image
-                    mode = "RGB" if pix.alpha == 0 else "RGBA"
-                    img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
-                    if img.mode != 'RGB':
-                        img = img.convert('RGB')
-                    
-                    # OSD rotation detection (only if metadata rotation is 0)
-                    if rotation == 0:
-                        try:
-                            osd = pytesseract.image_to_osd(img)
-                            detected_rotation = 0
-                            for line in osd.split("\n"):
-                                if "Rotate:" in line:
-                                    detected_rotation = int(line.split(":")[1].strip())
-                                    break
-                            if detected_rotation != 0:
-                                print(f"  Page {page_num + 1}: OSD detected rotation {detected_rotation}°, correcting...")
-                                img = img.rotate(-detected_rotation, expand=True)
-                        except Exception as e:
-                            print(f"  Page {page_num + 1}: OSD failed: {e}")
-                    
-                    append_debug_log(f"Process Page {page_num+1} - Full Page Tesseract Start")
-                    full_page_ocr = pytesseract.image_to_string(img, lang='ita')
-                    append_debug_log(f"Process Page {page_num+1} - Full Page Tesseract End")
-                    
-                    if word_count(full_page_ocr) > wc or is_text_quality_good(full_page_ocr):
-                        combined_text.append(full_page_ocr)
-                        print(f"  Page {page_num + 1}: Full-page OCR extracted {word_count(full_page_ocr)} words")
-                    else:
-                        combined_text.append(native_text)
-                        print(f"  Page {page_num + 1}: Kept native text ({wc} words) - OCR didn't improve")
+        with _open_pdf(file_path, doc) as pdf:
+            _hybrid_ocr_pipeline(pdf, OCR_EXECUTOR, _pipeline_slots(), page_data, ocr_pages, combined_text)
         
         append_debug_log(f"SEQUENTIAL OCR FINISHED")
         return "\n".join(combined_text)
@@ -462,12 +770,71 @@ def process_pdf_sequential(file_path: str, page_data: list, pages_needing_ocr: s
         print(err_msg)
         append_debug_log(err_msg)
 
-        text_tess = extract_with_tesseract(file_path)
+        text_tess = extract_with_tesseract(file_path, page_data, doc)
         return text_tess
 
 # ============================================================================
 
+def _ocr_settings_signature() -> str:
+    """Settings that change OCR output: part of the persistent cache key."""
+    return f"ita|zoom={OCR_RENDER_ZOOM}|text_zoom={OCR_TEXT_PAGE_ZOOM}|doctr={OCR_USE_DOCTR}"
+
+def _process_pdf_disk_cached(file_path: str) -> tuple[str, str]:
+    """_process_pdf_uncached behind the on-disk cache keyed by content hash."""
+    try:
+        key = f"{ocr_cache.file_digest(file_path)}|{_ocr_settings_signature()}"
+    except OSError:
+        return _process_pdf_uncached(file_path)
+    
+    cached = ocr_cache.get(key)
+    if cached is not None:
+        print(f"OCR cache hit for {os.path.basename(file_path)}")
+        return cached
+    
+    text, method = _process_pdf_uncached(file_path)
+    # Native extraction is cheap to redo: only store documents that went through OCR
+    if method != 'nativo' and _is_cacheable_result(text):
+        ocr_cache.put(key, text, method)
+    return text, method
+
+def _is_cacheable_result(text: str) -> bool:
+    """
+    A failed extraction ends up empty (the OCR fallbacks catch their errors and
+    return ""): never cache it, so a transient Tesseract/Doctr failure is retried.
+    """
+    return bool(text.strip())
+
+class _UncachedResult(Exception):
+    """Carries a result out of the lru_cache'd call: exceptions are never cached."""
+    def __init__(self, result: tuple):
+        super().__init__()
+        self.result = result
+
+@lru_cache(maxsize=16)
+def _process_pdf_cached(cache_key: tuple) -> tuple[str, str]:
+    text, method = _process_pdf_disk_cached(cache_key[0])
+    if not _is_cacheable_result(text):
+        raise _UncachedResult((text, method))
+    return text, method
+
 def process_pdf(file_path: str) -> tuple[str, str]:
+    """
+    Ritorna (testo_estratto, metodo_usato) - vedi _process_pdf_uncached.
+    Il risultato è in cache per (path, mtime, size): una seconda chiamata sullo
+    stesso file non rifà né l'estrazione nativa né l'OCR.
+    I documenti passati per l'OCR sono anche in cache su disco per hash del
+    contenuto (utils/ocr_cache.py): sopravvive a riavvii e ricaricamenti.
+    """
+    try:
+        cache_key = _file_cache_key(file_path)
+    except OSError:
+        return _process_pdf_uncached(file_path)
+    try:
+        return _process_pdf_cached(cache_key)
+    except _UncachedResult as e:
+        return e.result
+
+def _process_pdf_uncached(file_path: str) -> tuple[str, str]:
     """
     Ritorna (testo_estratto, metodo_usato)
     metodo_usato: 'nativo' | 'ibrido' | 'ocr_doctr' | 'ocr_tesseract'
@@ -481,7 +848,7 @@ def process_pdf(file_path: str) -> tuple[str, str]:
     MIN_WORDS_PER_PAGE = 50  # Soglia per considerare una pagina "ricca" di testo
     
     # Step 1: Analizza ogni pagina (ora restituisce 4 elementi)
-    page_data = get_page_word_counts(file_path)
+    page_data = analyze_pdf(file_path)
     
     if not page_data:
         # Fallback a Tesseract se non riusciamo a leggere il PDF
@@ -525,18 +892,28 @@ def process_pdf(file_path: str) -> tuple[str, str]:
     # Step 3: Approccio ibrido - usa PARALLEL OCR (Phase 2A)
     print(f"PDF classified as HYBRID - {len(pages_needing_ocr)} pages need OCR out of {num_pages}")
     
-    # ⚠️ WINDOWS FIX: Disable parallel processing on Windows to avoid spawn issues
-    if os.name == 'nt':
-        print("ℹ️ Windows detected: Using SEQUENTIAL OCR to avoid multiprocessing spawn issues")
-        text = process_pdf_sequential(file_path, page_data, pages_needing_ocr, num_pages)
-        return text, 'ibrido'
-
-    # Call parallel OCR (auto-falls back to sequential if RAM low or file small)
-    combined_text = process_pdf_parallel(file_path, page_data, pages_needing_ocr, num_pages)
+    # One parse of the PDF for every OCR step below (and their fallbacks)
+    with fitz.open(file_path) as doc:
+        # Optional: problematic pages through batched Doctr inference (falls back to Tesseract)
+        if OCR_USE_DOCTR:
+            try:
+                text = process_pdf_doctr_batch(file_path, page_data, pages_needing_ocr, doc)
+                return text, 'ibrido'
+            except Exception as e:
+                print(f"Doctr batch OCR failed, falling back to Tesseract: {e}")
+        
+        # Default: thread-pooled OCR in this process (no worker spawn cost, any OS).
+        # ⚠️ WINDOWS FIX: worker processes stay disabled on Windows (spawn issues)
+        if not OCR_USE_PROCESS_POOL or os.name == 'nt':
+            text = process_pdf_sequential(file_path, page_data, pages_needing_ocr, num_pages, doc)
+            return text, 'ibrido'
+    
+        # Call parallel OCR (auto-falls back to sequential if RAM low or file small)
+        combined_text = process_pdf_parallel(file_path, page_data, pages_needing_ocr, num_pages, doc)
     
     return combined_text, 'ibrido'
 
-# Doctr removed for VPS stability - use Tesseract only
+# Doctr disabled by default for VPS stability - Tesseract unless OCR_USE_DOCTR=true
 
 def process_image(file_path: str) -> tuple[str, str]:
     """Process an image file using Tesseract OCR."""
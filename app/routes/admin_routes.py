@@ -1,16 +1,23 @@
 """Admin routes for user management"""
 
-from fastapi import APIRouter, Request, Depends, HTTPException, status
+from fastapi import APIRouter, Request, Depends, HTTPException, Query, BackgroundTasks, status
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from pydantic import BaseModel
+from sqlalchemy import func, tuple_, case, literal, Float
+from sqlalchemy.exc import IntegrityError
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from decimal import Decimal
+import base64
+import binascii
 from ..database import get_db
 from .. import models, auth
+from ..email_service import send_welcome_email
+from ..system_settings import get_settings_cached, get_cost_rates_cached, ensure_settings, invalidate_settings_cache
 
-router = APIRouter()
+# orjson serializes the user list / analytics payloads several times faster
+router = APIRouter(default_response_class=ORJSONResponse)
 
 # Helper to check admin access
 def require_admin(request: Request, db: Session):
@@ -38,6 +45,8 @@ class UserUpdate(BaseModel):
     reset_password: Optional[str] = None
 
 class UserListItem(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     email: str
     username: Optional[str]
@@ -52,57 +61,92 @@ class UserListItem(BaseModel):
 
 class UserListResponse(BaseModel):
     users: List[UserListItem]
-    total: int
+    total: Optional[int] = None  # First page only (no cursor): later pages skip the COUNT(*)
+    next_cursor: Optional[str] = None  # Pass back as ?cursor= for the next page; None = last page
+
+# Only what UserListItem shows: no password hashes / Stripe fields loaded per row.
+# The flag/counter columns are NOT NULL, so rows map 1:1 onto UserListItem fields.
+USER_LIST_COLUMNS = (
+    models.User.id,
+    models.User.email,
+    models.User.username,
+    models.User.is_admin,
+    models.User.is_active,
+    models.User.access_expires_at,
+    models.User.last_login,
+    models.User.total_tokens_used,
+    models.User.total_input_tokens,
+    models.User.total_output_tokens,
+    models.User.created_at,
+)
+
+USERS_PAGE_SIZE = 50
+USERS_PAGE_SIZE_MAX = 500
+
+def encode_users_cursor(created_at: datetime, user_id: int) -> str:
+    """Opaque keyset cursor: position after (created_at, id) in newest-first order"""
+    raw = f"{created_at.isoformat()}|{user_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_users_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, user_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), int(user_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cursore non valido")
 
 # Routes
 
 @router.get("/users", response_model=UserListResponse)
-async def list_users(
+def list_users(
     request: Request,
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """List all users (admin only)"""
+    """List users, newest first, one keyset-paginated page at a time (admin only)"""
     require_admin(request, db)
     
-    users = db.query(models.User).order_by(models.User.created_at.desc()).all()
+    query = db.query(*USER_LIST_COLUMNS).order_by(models.User.created_at.desc(), models.User.id.desc())
+    if cursor:
+        cursor_created_at, cursor_id = decode_users_cursor(cursor)
+        query = query.filter(tuple_(models.User.created_at, models.User.id) < (cursor_created_at, cursor_id))
     
-    return UserListResponse(
-        users=[
-            UserListItem(
-                id=u.id,
-                email=u.email,
-                username=u.username,
-                is_admin=u.is_admin or False,
-                is_active=u.is_active if u.is_active is not None else True,
-                access_expires_at=u.access_expires_at,
-                last_login=u.last_login,
-                total_tokens_used=u.total_tokens_used or 0,
-                total_input_tokens=u.total_input_tokens or 0,
-                total_output_tokens=u.total_output_tokens or 0,
-                created_at=u.created_at
-            )
-            for u in users
-        ],
-        total=len(users)
-    )
+    # One extra row tells whether there is a next page
+    users = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_users_cursor(users[-1].created_at, users[-1].id)
+    
+    # Counting is a full scan: only the first page pays for it
+    total = None if cursor else db.query(func.count(models.User.id)).scalar()
+    
+    # Returned as a Response: the rows are already exactly UserListItem's
+    # fields, so FastAPI's response_model re-validation of every row is skipped
+    # (response_model still documents the shape)
+    return ORJSONResponse({
+        "users": [u._asdict() for u in users],
+        "total": total,
+        "next_cursor": next_cursor
+    })
+
+def send_welcome_email_task(email: str, username: str):
+    """Background task: SMTP/API latency stays out of the request (and its DB session)"""
+    if send_welcome_email(to_email=email, user_name=username):
+        print(f"[ADMIN] Welcome email sent to {email}")
 
 @router.post("/users", response_model=UserListItem)
-async def create_user(
+def create_user(
     request: Request,
     payload: UserCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """Create a new user (admin only)"""
     require_admin(request, db)
     
-    # Check if email already exists
-    existing = db.query(models.User).filter(models.User.email == payload.email).first()
-    if existing:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email già registrata"
-        )
-    
     # Validate password
     if len(payload.password) < 8:
         raise HTTPException(
@@ -115,36 +159,33 @@ async def create_user(
         email=payload.email,
         username=payload.email,  # Use email as username
         password_hash=auth.get_password_hash(payload.password),
+        password_algo=auth.DEFAULT_PASSWORD_ALGO,
         is_admin=payload.is_admin,
         is_active=True,
         access_expires_at=payload.access_expires_at
     )
     db.add(user)
+    try:
+        # The unique constraint on email decides: no SELECT-then-INSERT race
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email già registrata"
+        )
+    # id comes back from the INSERT, the defaults were set client-side:
+    # read everything before the commit expires it (no refresh SELECT)
+    item = UserListItem.model_validate(user)
     db.commit()
-    db.refresh(user)
     
-    # Send welcome email
-    from ..email_service import send_welcome_email
-    email_sent = send_welcome_email(to_email=user.email, user_name=user.username)
-    if email_sent:
-        print(f"[ADMIN] Welcome email sent to {user.email}")
+    # Send welcome email after the response
+    background_tasks.add_task(send_welcome_email_task, item.email, item.username)
     
-    return UserListItem(
-        id=user.id,
-        email=user.email,
-        username=user.username,
-        is_admin=user.is_admin or False,
-        is_active=user.is_active if user.is_active is not None else True,
-        access_expires_at=user.access_expires_at,
-        last_login=user.last_login,
-        total_tokens_used=user.total_tokens_used or 0,
-        total_input_tokens=user.total_input_tokens or 0,
-        total_output_tokens=user.total_output_tokens or 0,
-        created_at=user.created_at
-    )
+    return item
 
 @router.put("/users/{user_id}", response_model=UserListItem)
-async def update_user(
+def update_user(
     user_id: int,
     request: Request,
     payload: UserUpdate,
@@ -159,13 +200,7 @@ async def update_user(
     
     # Update fields if provided
     if payload.email is not None:
-        # Check if email is taken by another user
-        existing = db.query(models.User).filter(
-            models.User.email == payload.email,
-            models.User.id != user_id
-        ).first()
-        if existing:
-            raise HTTPException(status_code=400, detail="Email già in uso")
+        # Taken by another user -> IntegrityError on commit
         user.email = payload.email
     
     if payload.is_active is not None:
@@ -181,26 +216,21 @@ async def update_user(
         if len(payload.reset_password) < 8:
             raise HTTPException(status_code=400, detail="La password deve avere almeno 8 caratteri")
         user.password_hash = auth.get_password_hash(payload.reset_password)
+        user.password_algo = auth.DEFAULT_PASSWORD_ALGO
     
+    try:
+        db.flush()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Email già in uso")
+    # Only admin-set fields changed: build the response before the commit expires them
+    item = UserListItem.model_validate(user)
     db.commit()
-    db.refresh(user)
     
-    return UserListItem(
-        id=user.id,
-        email=user.email,
-        username=user.username,
-        is_admin=user.is_admin or False,
-        is_active=user.is_active if user.is_active is not None else True,
-        access_expires_at=user.access_expires_at,
-        last_login=user.last_login,
-        total_tokens_used=user.total_tokens_used or 0,
-        total_input_tokens=user.total_input_tokens or 0,
-        total_output_tokens=user.total_output_tokens or 0,
-        created_at=user.created_at
-    )
+    return item
 
 @router.delete("/users/{user_id}")
-async def delete_user(
+def delete_user(
     user_id: int,
     request: Request,
     db: Session = Depends(get_db)
@@ -235,20 +265,21 @@ class SettingsUpdate(BaseModel):
     output_cost_per_million: Optional[str] = None
 
 @router.get("/settings", response_model=SettingsResponse)
-async def get_settings(
+def get_settings(
     request: Request,
     db: Session = Depends(get_db)
 ):
     """Get system settings (admin only)"""
     require_admin(request, db)
     
-    # Get or create singleton settings
-    settings = db.query(models.SystemSettings).first()
+    # Read only: the row is created at startup (init_db); column defaults otherwise
+    settings = get_settings_cached(db)
     if not settings:
-        settings = models.SystemSettings()
-        db.add(settings)
-        db.commit()
-        db.refresh(settings)
+        return SettingsResponse(
+            llm_model_name=models.SystemSettings.llm_model_name.default.arg,
+            input_cost_per_million=models.SystemSettings.input_cost_per_million.default.arg,
+            output_cost_per_million=models.SystemSettings.output_cost_per_million.default.arg
+        )
     
     return SettingsResponse(
         llm_model_name=settings.llm_model_name,
@@ -257,7 +288,7 @@ async def get_settings(
     )
 
 @router.put("/settings", response_model=SettingsResponse)
-async def update_settings(
+def update_settings(
     request: Request,
     payload: SettingsUpdate,
     db: Session = Depends(get_db)
@@ -266,12 +297,7 @@ async def update_settings(
     require_admin(request, db)
     
     # Get or create singleton settings
-    settings = db.query(models.SystemSettings).first()
-    if not settings:
-        settings = models.SystemSettings()
-        db.add(settings)
-        db.commit()
-        db.refresh(settings)
+    settings = ensure_settings(db)
     
     # Update fields if provided
     if payload.llm_model_name is not None:
@@ -281,14 +307,16 @@ async def update_settings(
     if payload.output_cost_per_million is not None:
         settings.output_cost_per_million = payload.output_cost_per_million
 
-    db.commit()
-    db.refresh(settings)
-
-    return SettingsResponse(
+    # Values are already in memory: build the response before the commit expires them
+    response = SettingsResponse(
         llm_model_name=settings.llm_model_name,
         input_cost_per_million=settings.input_cost_per_million,
         output_cost_per_million=settings.output_cost_per_million
     )
+    db.commit()
+    invalidate_settings_cache()
+
+    return response
 
 
 # Analytics Routes
@@ -314,111 +342,112 @@ class CostAnalyticsResponse(BaseModel):
     monthly_data: List[MonthlyCostData]  # Last 12 months
 
 @router.get("/analytics/costs", response_model=CostAnalyticsResponse)
-async def get_cost_analytics(
+def get_cost_analytics(
     request: Request,
     db: Session = Depends(get_db)
 ):
     """Get token usage and cost analytics (admin only)"""
     require_admin(request, db)
 
-    # Get system settings for cost calculation
-    settings = db.query(models.SystemSettings).first()
-    if not settings:
-        settings = models.SystemSettings()
-
-    input_cost_per_million = float(settings.input_cost_per_million)
-    output_cost_per_million = float(settings.output_cost_per_million)
-
-    def calculate_cost(input_tokens: int, output_tokens: int) -> float:
-        """Calculate cost in USD"""
-        input_cost = (input_tokens / 1_000_000) * input_cost_per_million
-        output_cost = (output_tokens / 1_000_000) * output_cost_per_million
-        return round(input_cost + output_cost, 4)
-
-    # Get today's date
-    today = date.today()
-
-    # Query for today's data
-    today_data = db.query(
-        func.coalesce(func.sum(models.Analysis.input_tokens), 0).label('input_tokens'),
-        func.coalesce(func.sum(models.Analysis.output_tokens), 0).label('output_tokens')
-    ).filter(
-        func.date(models.Analysis.created_at) == today,
-        models.Analysis.status == models.AnalysisStatus.COMPLETED
-    ).first()
-
-    today_input = int(today_data.input_tokens) if today_data else 0
-    today_output = int(today_data.output_tokens) if today_data else 0
-
-    # Query for this month's data
-    this_month_start = today.replace(day=1)
-    this_month_data = db.query(
-        func.coalesce(func.sum(models.Analysis.input_tokens), 0).label('input_tokens'),
-        func.coalesce(func.sum(models.Analysis.output_tokens), 0).label('output_tokens')
-    ).filter(
-        func.date(models.Analysis.created_at) >= this_month_start,
-        models.Analysis.status == models.AnalysisStatus.COMPLETED
-    ).first()
-
-    month_input = int(this_month_data.input_tokens) if this_month_data else 0
-    month_output = int(this_month_data.output_tokens) if this_month_data else 0
-
-    # Query for all-time data
-    total_data = db.query(
-        func.coalesce(func.sum(models.Analysis.input_tokens), 0).label('input_tokens'),
-        func.coalesce(func.sum(models.Analysis.output_tokens), 0).label('output_tokens')
-    ).filter(
-        models.Analysis.status == models.AnalysisStatus.COMPLETED
-    ).first()
+    # Token pricing from the cached system settings (already parsed to float),
+    # bound into the aggregates so the DB returns each cost directly (USD)
+    input_cost_per_million, output_cost_per_million = get_cost_rates_cached(db)
+    input_rate = literal(input_cost_per_million / 1_000_000, Float)
+    output_rate = literal(output_cost_per_million / 1_000_000, Float)
 
-    total_input = int(total_data.input_tokens) if total_data else 0
-    total_output = int(total_data.output_tokens) if total_data else 0
+    def cost_of(input_tokens, output_tokens):
+        return input_tokens * input_rate + output_tokens * output_rate
 
-    # Query for monthly breakdown (last 12 months)
-    # Query for monthly breakdown (last 12 months)
     # Check dialect for correct date function
     is_sqlite = db.bind.dialect.name == "sqlite"
-    
-    if is_sqlite:
-        date_group = func.strftime('%Y-%m', models.Analysis.created_at)
-        date_col = date_group.label('month')
-    else:
+
+    def month_of(column):
+        if is_sqlite:
+            return func.strftime('%Y-%m', column)
         # Postgres
-        date_group = func.date_trunc('month', models.Analysis.created_at)
-        date_col = date_group.label('month')
+        return func.date_trunc('month', column)
+
+    def month_key(month_val) -> str:
+        # SQLite returns string, Postgres returns datetime
+        if isinstance(month_val, str):
+            return month_val
+        return month_val.strftime('%Y-%m') if month_val else ''
 
-    monthly_data = db.query(
-        date_col,
-        func.coalesce(func.sum(models.Analysis.input_tokens), 0).label('input_tokens'),
-        func.coalesce(func.sum(models.Analysis.output_tokens), 0).label('output_tokens')
+    # Get today's date
+    today = date.today()
+    today_start = datetime.combine(today, datetime.min.time())
+
+    # Closed days come from the daily rollup (a few hundred rows per year)
+    month_totals = {}  # 'YYYY-MM' -> [input_tokens, output_tokens, cost]
+    rollup_through = None
+    rollup_month = month_of(models.AnalysisUsageDaily.date)
+    rollup_input = func.coalesce(func.sum(models.AnalysisUsageDaily.input_tokens), 0)
+    rollup_output = func.coalesce(func.sum(models.AnalysisUsageDaily.output_tokens), 0)
+    for row in db.query(
+        rollup_month.label('month'),
+        func.max(models.AnalysisUsageDaily.date).label('last_day'),
+        rollup_input.label('input_tokens'),
+        rollup_output.label('output_tokens'),
+        cost_of(rollup_input, rollup_output).label('cost')
+    ).group_by(rollup_month).all():
+        month_totals[month_key(row.month)] = [int(row.input_tokens), int(row.output_tokens), float(row.cost)]
+        if rollup_through is None or row.last_day > rollup_through:
+            rollup_through = row.last_day
+
+    # Days not rolled up yet (today at least) from analyses: per-month sums
+    # plus today's sums as filtered aggregates, one round-trip
+    date_group = month_of(models.Analysis.created_at)
+    is_today = models.Analysis.created_at >= today_start
+    live_input = func.coalesce(func.sum(models.Analysis.input_tokens), 0)
+    live_output = func.coalesce(func.sum(models.Analysis.output_tokens), 0)
+    today_input_sum = func.coalesce(func.sum(case((is_today, models.Analysis.input_tokens), else_=0)), 0)
+    today_output_sum = func.coalesce(func.sum(case((is_today, models.Analysis.output_tokens), else_=0)), 0)
+
+    live_query = db.query(
+        date_group.label('month'),
+        live_input.label('input_tokens'),
+        live_output.label('output_tokens'),
+        cost_of(live_input, live_output).label('cost'),
+        today_input_sum.label('today_input'),
+        today_output_sum.label('today_output'),
+        cost_of(today_input_sum, today_output_sum).label('today_cost')
     ).filter(
         models.Analysis.status == models.AnalysisStatus.COMPLETED,
         models.Analysis.created_at.isnot(None)
-    ).group_by(
-        date_group
-    ).order_by(
-        date_group.desc()
-    ).limit(12).all()
+    )
+    if rollup_through is not None:
+        live_query = live_query.filter(
+            models.Analysis.created_at >= datetime.combine(rollup_through + timedelta(days=1), datetime.min.time())
+        )
+    live_rows = live_query.group_by(date_group).all()
+
+    today_input = today_output = 0
+    today_cost = 0.0
+    for row in live_rows:
+        totals = month_totals.setdefault(month_key(row.month), [0, 0, 0.0])
+        totals[0] += int(row.input_tokens)
+        totals[1] += int(row.output_tokens)
+        totals[2] += float(row.cost)
+        today_input += int(row.today_input)
+        today_output += int(row.today_output)
+        today_cost += float(row.today_cost)
+
+    total_input = sum(totals[0] for totals in month_totals.values())
+    total_output = sum(totals[1] for totals in month_totals.values())
+    total_cost = sum(totals[2] for totals in month_totals.values())
+    month_input, month_output, month_cost = month_totals.get(today.strftime('%Y-%m'), (0, 0, 0.0))
+
+    # Last 12 months for the breakdown (newest first)
+    monthly_data = sorted(month_totals.items(), reverse=True)[:12]
 
     monthly_list = []
-    for row in monthly_data:
-        month_val = row.month
-        # SQLite returns string, Postgres returns datetime
-        if isinstance(month_val, str):
-             month_str = month_val
-        elif month_val:
-             month_str = month_val.strftime('%Y-%m')
-        else:
-             month_str = ''
-             
-        m_input = int(row.input_tokens)
-        m_output = int(row.output_tokens)
+    for month_str, (m_input, m_output, m_cost) in monthly_data:
         monthly_list.append(MonthlyCostData(
             month=month_str,
             input_tokens=m_input,
             output_tokens=m_output,
             total_tokens=m_input + m_output,
-            cost=calculate_cost(m_input, m_output)
+            cost=round(m_cost, 4)
         ))
 
     # Reverse to get chronological order
@@ -430,21 +459,21 @@ async def get_cost_analytics(
             input_tokens=today_input,
             output_tokens=today_output,
             total_tokens=today_input + today_output,
-            cost=calculate_cost(today_input, today_output)
+            cost=round(today_cost, 4)
         ),
         this_month=MonthlyCostData(
             month=today.strftime('%Y-%m'),
             input_tokens=month_input,
             output_tokens=month_output,
             total_tokens=month_input + month_output,
-            cost=calculate_cost(month_input, month_output)
+            cost=round(month_cost, 4)
         ),
         total=DailyCostData(
             date='all-time',
             input_tokens=total_input,
             output_tokens=total_output,
             total_tokens=total_input + total_output,
-            cost=calculate_cost(total_input, total_output)
+            cost=round(total_cost, 4)
         ),
         monthly_data=monthly_list
     )
@@ -1,10 +1,16 @@
 import os
+import re
 import json
 import base64
+import glob
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from fastapi import APIRouter, Request, Depends, HTTPException, BackgroundTasks
-from fastapi.responses import Response, JSONResponse
-from sqlalchemy.orm import Session
+from functools import lru_cache
+from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi.responses import Response, JSONResponse, FileResponse, StreamingResponse
+from sqlalchemy.orm import Session, load_only
 from pydantic import BaseModel
 from typing import Optional, List, Dict
 try:
@@ -15,19 +21,120 @@ except OSError:
     # Handle GTK3 missing on Windows
     HTML = None
 
-from ..database import get_db
+from ..database import get_db, SessionLocal
 from .. import models, masking, llm_client
 from ..config import settings
+from ..system_settings import get_settings_cached
+from ..utils.text_files import read_text_file_if_exists
 try:
     from weasyprint import HTML
     HAS_WEASYPRINT = True
 except (ImportError, OSError):
     HAS_WEASYPRINT = False
-from xhtml2pdf import pisa
+try:
+    from xhtml2pdf import pisa
+    HAS_XHTML2PDF = True
+except ImportError:
+    HAS_XHTML2PDF = False
 from io import BytesIO
 
 router = APIRouter()
 
+# Analyses run on their own bounded pool rather than as BackgroundTasks: those
+# share the request threadpool with every sync endpoint, so a burst of
+# minute-long LLM analyses would starve unrelated requests. Extra analyses queue.
+ANALYSIS_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(1, settings.MAX_CONCURRENT_ANALYSES),
+    thread_name_prefix="analysis"
+)
+
+# HTML -> PDF is CPU-bound pure Python holding the GIL: more concurrent renders
+# than this only slow each other down while occupying request threads.
+PDF_RENDER_SEMAPHORE = threading.BoundedSemaphore(max(1, settings.MAX_CONCURRENT_PDF_RENDERS))
+
+def render_pdf_bytes(html_content: str):
+    """
+    Render HTML to PDF with WeasyPrint, falling back to xhtml2pdf. Raises if both fail.
+    Returns a bytes-like object (xhtml2pdf: a view on its buffer, no getvalue() copy).
+    """
+    with PDF_RENDER_SEMAPHORE:
+        if HAS_WEASYPRINT:
+            try:
+                return HTML(string=html_content).write_pdf()
+            except Exception as e:
+                print(f"WeasyPrint runtime error: {e}. Falling back to xhtml2pdf.")
+
+        if not HAS_XHTML2PDF:
+            raise Exception("PDF generation failed: WeasyPrint unavailable and xhtml2pdf not installed")
+        print("Generating PDF with xhtml2pdf...")
+        buffer = BytesIO()
+        pisa_status = pisa.CreatePDF(html_content, dest=buffer)
+        if pisa_status.err:
+            print("xhtml2pdf error")
+            raise Exception("PDF generation failed with both engines")
+        return buffer.getbuffer()
+
+# Rendered PDFs, keyed by a hash of the report HTML: an edit changes the key
+PDF_CACHE_DIR = os.path.join("outputs", "pdf_cache")
+# no-cache: the URL is fixed, so the browser must revalidate (ETag) on every download
+PDF_CACHE_CONTROL = "private, no-cache"
+PDF_LOGO_PATH = os.path.join(os.getcwd(), "static", "img", "logo-white.png")
+PDF_CHARTS_MODULE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "charts.py")
+
+def _mtime_ns(path: str) -> int:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return 0
+
+def pdf_render_key(html_content: str) -> str:
+    """
+    Cache/ETag key of a rendered PDF: the report HTML (chart data is extracted
+    from it) plus the other render inputs - the cover logo and the chart renderer.
+    """
+    h = hashlib.blake2b(html_content.encode("utf-8"), digest_size=16)
+    h.update(f"|{_mtime_ns(PDF_LOGO_PATH)}|{_mtime_ns(PDF_CHARTS_MODULE_PATH)}".encode())
+    return h.hexdigest()
+
+# Chart.js arrays emitted by the prompt templates (compiled once, not per PDF request)
+_CHART_LABELS_RE = re.compile(r"labels:\s*\[(.*?)\]")
+_CHART_PREMI_RE = re.compile(r"label:\s*['\"]Premio.*?['\"],\s*data:\s*\[(.*?)\]", re.DOTALL)
+_CHART_SINISTRI_RE = re.compile(r"label:\s*['\"]Sinistri.*?['\"],\s*data:\s*\[(.*?)\]", re.DOTALL)
+
+def pdf_cache_path(analysis_id: int, suffix: str, html_key: str) -> str:
+    return os.path.join(PDF_CACHE_DIR, f"{analysis_id}{suffix}_{html_key}.pdf")
+
+def store_cached_pdf(analysis_id: int, suffix: str, html_key: str, pdf_bytes) -> Optional[str]:
+    """Write the PDF atomically and drop older renders of the same report/version; path or None"""
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        path = pdf_cache_path(analysis_id, suffix, html_key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, path)
+        for stale in glob.glob(pdf_cache_path(analysis_id, suffix, "*")):
+            if stale != path:
+                os.remove(stale)
+        return path
+    except OSError as e:
+        print(f"Warning: PDF cache write failed: {e}")
+        return None
+
+def remove_cached_pdfs(analysis_id: int):
+    for path in glob.glob(os.path.join(PDF_CACHE_DIR, f"{analysis_id}_*.pdf")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+HTML_DOWNLOAD_CHUNK_CHARS = 64 * 1024
+
+def iter_html_chunks(html_content: str):
+    """UTF-8 encoded 64K slices: the whole report is never encoded in one extra copy"""
+    for start in range(0, len(html_content), HTML_DOWNLOAD_CHUNK_CHARS):
+        yield html_content[start:start + HTML_DOWNLOAD_CHUNK_CHARS].encode("utf-8")
+
 # Request/Response Models
 
 class MaskingData(BaseModel):
@@ -205,7 +312,6 @@ async def list_analyses(
 @router.post("/start", response_model=StartAnalysisResponse)
 async def start_analysis(
     request: Request,
-    background_tasks: BackgroundTasks,
     payload: StartAnalysisRequest,
     db: Session = Depends(get_db)
 ):
@@ -215,7 +321,14 @@ async def start_analysis(
         raise HTTPException(status_code=401, detail="Not authenticated")
     
     # Validate documents exist and belong to user
-    docs = db.query(models.Document).filter(
+    # Only the columns used below: plain rows, no ORM hydration of the whole document
+    docs = db.query(
+        models.Document.id,
+        models.Document.original_filename,
+        models.Document.stored_filename,
+        models.Document.extracted_text_path,
+        models.Document.token_count
+    ).filter(
         models.Document.id.in_(payload.document_ids),
         models.Document.user_id == user_data["id"]
     ).all()
@@ -238,6 +351,17 @@ async def start_analysis(
     docs_map = {d.id: d for d in docs}
     ordered_docs = [docs_map[d_id] for d_id in payload.document_ids if d_id in docs_map]
     primary_doc = ordered_docs[0]
+    # Handed to the pipeline so it doesn't query the same documents again
+    docs_payload = [
+        {
+            'id': d.id,
+            'path': d.extracted_text_path,
+            'filename': d.original_filename,
+            'tokens': d.token_count or 0,
+            'stored': d.stored_filename
+        }
+        for d in ordered_docs
+    ]
     
     # 🔒 CRITICAL SECURITY: Validate document_ids before JSON serialization
     # Prevents SQL injection via malicious JSON payload
@@ -251,7 +375,7 @@ async def start_analysis(
     selected_model = payload.llm_model
     if not selected_model:
         # Fetch from SystemSettings
-        settings_obj = db.query(models.SystemSettings).first()
+        settings_obj = get_settings_cached(db)
         if settings_obj and settings_obj.llm_model_name:
             selected_model = settings_obj.llm_model_name
         else:
@@ -261,7 +385,7 @@ async def start_analysis(
     # Create Analysis record
     analysis = models.Analysis(
         document_id=primary_doc.id,
-        source_document_ids=json.dumps(payload.document_ids),  # Now safe to serialize
+        source_document_ids=json.dumps(payload.document_ids, separators=(",", ":")),  # Now safe to serialize
         status=models.AnalysisStatus.ANALYZING,
         policy_type=payload.policy_type,
         prompt_level=payload.analysis_level,
@@ -278,7 +402,6 @@ async def start_analysis(
         md = payload.masking_data
         altri_raw = md.get_altri()
         # Support both semicolon and newline separators
-        import re
         altri_list = []
         if altri_raw:
             # Split by ; or newline
@@ -296,10 +419,10 @@ async def start_analysis(
         }
     
     # Run analysis in background
-    background_tasks.add_task(
+    future = ANALYSIS_EXECUTOR.submit(
         full_analysis_pipeline,
         analysis.id,
-        payload.document_ids,
+        docs_payload,
         sensitive_data,
         payload.skip_masking,
         payload.analysis_level,
@@ -307,6 +430,7 @@ async def start_analysis(
         payload.llm_model,
         user_data["id"]  # Pass user ID for token tracking
     )
+    future.add_done_callback(lambda fut, analysis_id=analysis.id: _on_pipeline_done(analysis_id, fut))
     
     return StartAnalysisResponse(
         analysis_id=analysis.id,
@@ -325,14 +449,29 @@ async def get_analysis(
     if not user_data:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    analysis = db.query(models.Analysis).filter(models.Analysis.id == analysis_id).first()
+    # Only the returned columns (not reverse_mapping_json & co.), owner in the same query
+    row = db.query(models.Analysis, models.Document.user_id).options(
+        load_only(
+            models.Analysis.id,
+            models.Analysis.status,
+            models.Analysis.policy_type,
+            models.Analysis.prompt_level,
+            models.Analysis.created_at,
+            models.Analysis.completed_at,
+            models.Analysis.report_html_display,
+            models.Analysis.report_html_masked,
+            models.Analysis.error_message
+        )
+    ).outerjoin(
+        models.Document, models.Document.id == models.Analysis.document_id
+    ).filter(models.Analysis.id == analysis_id).first()
     
-    if not analysis:
+    if not row:
         raise HTTPException(status_code=404, detail="Analysis not found")
+    analysis, owner_id = row
     
     # Verify ownership
-    doc = db.query(models.Document).filter(models.Document.id == analysis.document_id).first()
-    if doc and doc.user_id != user_data["id"]:
+    if owner_id is not None and owner_id != user_data["id"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
     return AnalysisResponse(
@@ -358,16 +497,17 @@ async def get_analysis_html(
     if not user_data:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    analysis = db.query(models.Analysis).filter(models.Analysis.id == analysis_id).first()
+    # Just the display HTML: the masked copy is never loaded
+    row = db.query(models.Analysis.report_html_display).filter(models.Analysis.id == analysis_id).first()
     
-    if not analysis:
+    if not row:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
-    if not analysis.report_html_display:
+    if not row.report_html_display:
         raise HTTPException(status_code=404, detail="Report not ready")
     
     return Response(
-        content=analysis.report_html_display,
+        content=row.report_html_display,
         media_type="text/html"
     )
 
@@ -383,19 +523,22 @@ def download_analysis_html(
     if not user_data:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    analysis = db.query(models.Analysis).filter(models.Analysis.id == analysis_id).first()
-    
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analysis not found")
-    
-    # Select HTML content based on type
+    # Select HTML content based on type: only that column (and the title) is loaded
     if type == "masked":
-        html_content = analysis.report_html_masked
+        html_column = models.Analysis.report_html_masked
         suffix = "_mascherato"
     else:
-        html_content = analysis.report_html_display
+        html_column = models.Analysis.report_html_display
         suffix = "_chiaro"
     
+    analysis = db.query(html_column.label("html"), models.Analysis.title).filter(
+        models.Analysis.id == analysis_id
+    ).first()
+    
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    html_content = analysis.html
     if not html_content:
         raise HTTPException(status_code=404, detail="Report content not ready")
     
@@ -405,8 +548,9 @@ def download_analysis_html(
         safe_title = "".join([c for c in analysis.title if c.isalnum() or c in (' ', '-', '_')]).strip()
         filename = f"{safe_title}{suffix}.html"
     
-    return Response(
-        content=html_content,
+    # Chunked transfer: first bytes go out before the whole report is encoded
+    return StreamingResponse(
+        iter_html_chunks(html_content),
         media_type="text/html",
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
@@ -423,19 +567,22 @@ def download_analysis_pdf(
     if not user_data:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    analysis = db.query(models.Analysis).filter(models.Analysis.id == analysis_id).first()
-    
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analysis not found")
-    
-    # Select HTML content based on type
+    # Select HTML content based on type: only that column (and the title) is loaded
     if type == "masked":
-        html_content = analysis.report_html_masked
+        html_column = models.Analysis.report_html_masked
         suffix = "_mascherato"
     else:
-        html_content = analysis.report_html_display
+        html_column = models.Analysis.report_html_display
         suffix = "_chiaro"
     
+    analysis = db.query(html_column.label("html"), models.Analysis.title).filter(
+        models.Analysis.id == analysis_id
+    ).first()
+    
+    if not analysis:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    html_content = analysis.html
     if not html_content:
         raise HTTPException(status_code=404, detail="Report content not ready")
     
@@ -445,13 +592,25 @@ def download_analysis_pdf(
         safe_title = "".join([c for c in analysis.title if c.isalnum() or c in (' ', '-', '_')]).strip()
         filename = f"{safe_title}{suffix}.pdf"
 
-
+    # Same report HTML (and logo/chart code) -> same PDF: answer from the client or disk cache
+    html_key = pdf_render_key(html_content)
+    etag = f'"{html_key}"'
+    headers = {
+        "Content-Disposition": f"attachment; filename={filename}",
+        "Cache-Control": PDF_CACHE_CONTROL,
+        "ETag": etag
+    }
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"Cache-Control": PDF_CACHE_CONTROL, "ETag": etag})
+    cached_path = pdf_cache_path(analysis_id, suffix, html_key)
+    if os.path.exists(cached_path):
+        return FileResponse(cached_path, media_type="application/pdf", headers=headers)
 
     # Inject Logo for PDF Cover
     try:
         # Use direct path from app root
         # logo_path = "/app/static/img/logo-white.png" # Linux/Docker only
-        logo_path = os.path.join(os.getcwd(), "static", "img", "logo-white.png")
+        logo_path = PDF_LOGO_PATH
 
         if os.path.exists(logo_path):
             with open(logo_path, "rb") as image_file:
@@ -469,7 +628,6 @@ def download_analysis_pdf(
     try:
         # Import chart generation module locally to avoid circular imports or issues if unavailable
         from ..charts import generate_bar_chart
-        import re
 
         # Initialize default chart data
         chart_labels = ['Anno 1', 'Anno 2', 'Anno 3']
@@ -492,19 +650,19 @@ def download_analysis_pdf(
 
         try:
             # Extract Labels: labels: ['2023', '2024']
-            labels_match = re.search(r"labels:\s*\[(.*?)\]", html_content)
+            labels_match = _CHART_LABELS_RE.search(html_content)
             if labels_match:
                 labels_str = labels_match.group(1)
                 chart_labels = [label.strip().strip("'").strip('"') for label in labels_str.split(',')]
 
             # Extract Premi: label: 'Premio Imponibile', data: [1000, 2000]
-            premi_match = re.search(r"label:\s*['\"]Premio.*?['\"],\s*data:\s*\[(.*?)\]", html_content, re.DOTALL)
+            premi_match = _CHART_PREMI_RE.search(html_content)
             if premi_match:
                 premi_data_str = premi_match.group(1)
                 chart_datasets[0]["data"] = [float(x.strip()) for x in premi_data_str.split(',') if x.strip()]
 
             # Extract Sinistri: label: 'Sinistri Pagati', data: [0, 500]
-            sinistri_match = re.search(r"label:\s*['\"]Sinistri.*?['\"],\s*data:\s*\[(.*?)\]", html_content, re.DOTALL)
+            sinistri_match = _CHART_SINISTRI_RE.search(html_content)
             if sinistri_match:
                 sinistri_data_str = sinistri_match.group(1)
                 chart_datasets[1]["data"] = [float(x.strip()) for x in sinistri_data_str.split(',') if x.strip()]
@@ -534,36 +692,22 @@ def download_analysis_pdf(
         print(f"Error generating PDF chart: {e}")
 
 
-    # Generate PDF using WeasyPrint
     # Generate PDF using WeasyPrint with Fallback to xhtml2pdf
-    pdf_bytes = None
-    
-    if HAS_WEASYPRINT:
-        try:
-            pdf_bytes = HTML(string=html_content).write_pdf()
-        except Exception as e:
-            print(f"WeasyPrint runtime error: {e}. Falling back to xhtml2pdf.")
-            # Fallback will trigger below
-            pdf_bytes = None
+    try:
+        pdf_bytes = render_pdf_bytes(html_content)
+    except Exception as e:
+        print(f"xhtml2pdf Exception: {e}")
+        raise HTTPException(status_code=500, detail=f"PDF Generation failed: {str(e)}")
 
-    if pdf_bytes is None:
-        try:
-            print("Generating PDF with xhtml2pdf...")
-            buffer = BytesIO()
-            pisa_status = pisa.CreatePDF(html_content, dest=buffer)
-            if not pisa_status.err:
-                pdf_bytes = buffer.getvalue()
-            else:
-                print("xhtml2pdf error")
-                raise Exception("PDF generation failed with both engines")
-        except Exception as e:
-            print(f"xhtml2pdf Exception: {e}")
-            raise HTTPException(status_code=500, detail=f"PDF Generation failed: {str(e)}")
+    # Served from the cache file just written (streamed from disk, no extra copy in memory)
+    cached_path = store_cached_pdf(analysis_id, suffix, html_key, pdf_bytes)
+    if cached_path:
+        return FileResponse(cached_path, media_type="application/pdf", headers=headers)
 
     return Response(
-        content=pdf_bytes,
+        content=bytes(pdf_bytes),
         media_type="application/pdf",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        headers=headers
     )
 
 class UpdateAnalysisContentRequest(BaseModel):
@@ -581,17 +725,20 @@ async def update_analysis_content(
     if not user_data:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    analysis = db.query(models.Analysis).filter(models.Analysis.id == analysis_id).first()
-    
-    if not analysis:
-        raise HTTPException(status_code=404, detail="Analysis not found")
-    
     # Check if html_content is valid
     if not payload.html_content or len(payload.html_content) < 100:
         raise HTTPException(status_code=400, detail="Invalid HTML content")
     
-    analysis.report_html_display = payload.html_content
-    analysis.last_updated = datetime.utcnow()
+    # Single UPDATE: the rowcount tells whether the analysis exists (no row load)
+    updated = db.query(models.Analysis).filter(models.Analysis.id == analysis_id).update(
+        {
+            models.Analysis.report_html_display: payload.html_content,
+            models.Analysis.last_updated: datetime.utcnow()
+        },
+        synchronize_session=False
+    )
+    if not updated:
+        raise HTTPException(status_code=404, detail="Analysis not found")
     db.commit()
     
     return {"status": "success", "message": "Report updated"}
@@ -646,19 +793,24 @@ async def delete_analysis(
     if not user_data:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    analysis = db.query(models.Analysis).filter(models.Analysis.id == analysis_id).first()
+    # Owner of the primary document in the same query (outer join: multi-doc
+    # analyses may have no document_id)
+    row = db.query(models.Analysis, models.Document.user_id).outerjoin(
+        models.Document, models.Document.id == models.Analysis.document_id
+    ).filter(models.Analysis.id == analysis_id).first()
     
-    if not analysis:
+    if not row:
         raise HTTPException(status_code=404, detail="Analysis not found")
+    analysis, owner_id = row
     
     # Verify ownership
-    doc = db.query(models.Document).filter(models.Document.id == analysis.document_id).first()
-    if doc and doc.user_id != user_data["id"]:
+    if owner_id is not None and owner_id != user_data["id"]:
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Delete masked text file if exists
     if analysis.masked_text_path and os.path.exists(analysis.masked_text_path):
         os.remove(analysis.masked_text_path)
+    remove_cached_pdfs(analysis_id)
     
     db.delete(analysis)
     db.commit()
@@ -676,17 +828,21 @@ async def dismiss_analysis_from_dashboard(
     if not user_data:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
-    analysis = db.query(models.Analysis).filter(models.Analysis.id == analysis_id).first()
+    # Existence + owner in one indexed lookup, no full row load
+    row = db.query(models.Analysis.id, models.Document.user_id).outerjoin(
+        models.Document, models.Document.id == models.Analysis.document_id
+    ).filter(models.Analysis.id == analysis_id).first()
     
-    if not analysis:
+    if not row:
         raise HTTPException(status_code=404, detail="Analysis not found")
     
     # Verify ownership
-    doc = db.query(models.Document).filter(models.Document.id == analysis.document_id).first()
-    if doc and doc.user_id != user_data["id"]:
+    if row.user_id is not None and row.user_id != user_data["id"]:
         raise HTTPException(status_code=403, detail="Access denied")
         
-    analysis.show_in_dashboard = False
+    db.query(models.Analysis).filter(models.Analysis.id == analysis_id).update(
+        {models.Analysis.show_in_dashboard: False}, synchronize_session=False
+    )
     db.commit()
     
     return {"status": "success", "message": "Analysis hidden from dashboard"}
@@ -694,9 +850,112 @@ async def dismiss_analysis_from_dashboard(
 
 # Background Analysis Pipeline (unchanged core logic)
 
+# policy_type ends up in prompt/template paths: keep only [A-Za-z0-9_-]
+_UNSAFE_POLICY_CHARS_RE = re.compile(r'[^A-Za-z0-9_-]')
+
+@lru_cache(maxsize=64)
+def _read_prompt_file(path: str, mtime: float) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+def load_prompt_file(path: str) -> str:
+    """Prompt/template file content, cached per process; an edited file (new mtime) is re-read"""
+    return _read_prompt_file(path, os.path.getmtime(path))
+
+def _prompt_candidates(safe_policy_type: str, analysis_level: str) -> tuple:
+    """(folder, prompt_path, template_path) by naming convention, before any fallback"""
+    # Determina la cartella base e il tipo di polizza
+    if analysis_level == "sinistro":
+        base_folder = "analisi_sinistri"
+        # Rimuovi "rc_generale" -> "rc" per sinistri
+        folder_type = safe_policy_type.replace("rc_generale", "rc")
+        # Nuova convenzione: prompt_sinistro_{type}.txt
+        prompt_path = f"prompts/{base_folder}/{folder_type}/prompt_sinistro_{folder_type}.txt"
+        template_path = f"prompts/{base_folder}/{folder_type}/template_sinistro_{folder_type}.html"
+        
+    elif safe_policy_type == "analisi_economica":
+        base_folder = "analisi_economica"
+        folder_type = "standard" # Default folder for now
+        # Naming convention: prompt_{type}_{variant}.txt
+        prompt_path = f"prompts/{base_folder}/{folder_type}/prompt_analisi_economica_standard.txt"
+        template_path = f"prompts/{base_folder}/{folder_type}/template_analisi_economica_standard.html"
+    elif safe_policy_type == "analisi_capitolati":
+        base_folder = "analisi_capitolati"
+        folder_type = "standard" # Default folder for now
+        prompt_path = f"prompts/{base_folder}/{folder_type}/prompt_analisi_capitolati.txt"
+        template_path = f"prompts/{base_folder}/{folder_type}/template_analisi_capitolati.html"
+    else:
+        base_folder = "analisi_polizze"
+        folder_type = safe_policy_type
+        # Nuova convenzione: prompt_{type}_{level}.txt
+        prompt_path = f"prompts/{base_folder}/{folder_type}/prompt_{folder_type}_{analysis_level}.txt"
+        template_path = f"prompts/{base_folder}/{folder_type}/template_{folder_type}_{analysis_level}.html"
+    
+    return f"prompts/{base_folder}/{folder_type}", prompt_path, template_path
+
+@lru_cache(maxsize=64)
+def _resolve_prompt_fallbacks(folder: str, prompt_path: str, template_path: str, folder_mtime: int) -> tuple:
+    # Fallback per file non trovati
+    if not os.path.exists(prompt_path):
+        # Prova con nome generico base.txt
+        fallback_prompt = f"{folder}/base.txt"
+        if os.path.exists(fallback_prompt):
+            prompt_path = fallback_prompt
+        else:
+            print(f"WARNING: Prompt file not found: {prompt_path}")
+    
+    if not os.path.exists(template_path):
+        # Prova con nome generico template.html
+        fallback_template = f"{folder}/template.html"
+        if os.path.exists(fallback_template):
+            template_path = fallback_template
+        else:
+            print(f"WARNING: Template file not found: {template_path}")
+    
+    return prompt_path, template_path
+
+def resolve_prompt_paths(safe_policy_type: str, analysis_level: str) -> tuple:
+    """
+    (prompt_path, template_path) for a policy type / level, fallbacks included.
+    The exists() probes are cached per folder mtime: one stat per analysis, and
+    a prompt added or renamed after startup is picked up (like load_prompt_file).
+    """
+    folder, prompt_path, template_path = _prompt_candidates(safe_policy_type, analysis_level)
+    try:
+        folder_mtime = os.stat(folder).st_mtime_ns
+    except OSError:
+        folder_mtime = 0
+    return _resolve_prompt_fallbacks(folder, prompt_path, template_path, folder_mtime)
+
+def _on_pipeline_done(analysis_id: int, future):
+    """
+    Executor callback: the pipeline handles its own errors, but anything escaping
+    it (e.g. opening the session) would otherwise vanish with the future and
+    leave the analysis stuck in ANALYZING.
+    """
+    # Cancelled = dropped from the queue at shutdown, never started
+    exc = RuntimeError("Analysis cancelled") if future.cancelled() else future.exception()
+    if exc is None:
+        return
+    print(f"Analysis Pipeline crashed for {analysis_id}: {exc!r}")
+    db = SessionLocal()
+    try:
+        db.query(models.Analysis).filter(
+            models.Analysis.id == analysis_id,
+            models.Analysis.status == models.AnalysisStatus.ANALYZING
+        ).update({
+            models.Analysis.status: models.AnalysisStatus.ERROR,
+            models.Analysis.error_message: str(exc)
+        }, synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        print(f"Could not mark analysis {analysis_id} as failed: {e}")
+    finally:
+        db.close()
+
 def full_analysis_pipeline(
     analysis_id: int,
-    doc_ids_list: List[int],
+    docs_payload: List[dict],
     sensitive_data: dict,
     is_skipped: bool,
     analysis_level: str,
@@ -704,7 +963,6 @@ def full_analysis_pipeline(
     llm_model: str,
     user_id: int
 ):
-    from ..database import SessionLocal
     db = SessionLocal()
     
     try:
@@ -713,102 +971,67 @@ def full_analysis_pipeline(
             return
         
         # 1. Combine Text
-        docs = db.query(models.Document).filter(models.Document.id.in_(doc_ids_list)).all()
-        docs_map = {d.id: d for d in docs}
-        ordered_docs = [docs_map[d_id] for d_id in doc_ids_list if d_id in docs_map]
+        # docs_payload comes from start_analysis, already validated and in request order
+        # Missing files come back as None (no separate exists() stat per path)
+        # Reads overlap (slow/network storage): wall time ~ the slowest file
+        text_paths = [doc['path'] for doc in docs_payload]
+        if len(text_paths) > 1:
+            with ThreadPoolExecutor(max_workers=min(8, len(text_paths))) as reader:
+                contents = list(reader.map(read_text_file_if_exists, text_paths))
+        else:
+            contents = [read_text_file_if_exists(path) for path in text_paths]
         
-        original_text = ""
+        text_parts = []  # Joined once: += would copy the growing text per document
         total_tokens = 0
         
-        for doc in ordered_docs:
-            if doc.extracted_text_path and os.path.exists(doc.extracted_text_path):
-                with open(doc.extracted_text_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                    original_text += f"\n\n--- DOCUMENTO: {doc.original_filename} ---\n\n"
-                    original_text += content
-                total_tokens += doc.token_count or 0
+        for doc, content in zip(docs_payload, contents):
+            if content is None:
+                continue
+            text_parts.append(f"\n\n--- DOCUMENTO: {doc['filename']} ---\n\n")
+            text_parts.append(content)
+            total_tokens += doc['tokens']
+        del contents  # text_parts owns the texts now
         
-        original_text = original_text.strip()
+        # Committed together with the masking results below
         analysis.total_tokens = total_tokens
-        db.commit()
         
-        # 2. Masking
-        masked_text = original_text
+        # 2. Masking: per part and in place, so the unmasked combined text is
+        # never built next to the masked one (peak ~1x input instead of ~3x)
         reverse_mapping = {}
         
         if not is_skipped and sensitive_data:
-            masked_text, _, reverse_mapping = masking.mask_document(original_text, sensitive_data)
+            _, reverse_mapping = masking.mask_chunks(text_parts, sensitive_data)
+        
+        masked_text = "".join(text_parts).strip()
+        del text_parts
         
         # 3. Save Masked Text
-        primary_doc = ordered_docs[0]
-        masked_filename = f"{primary_doc.stored_filename}.combined.masked.txt"
+        primary_doc = docs_payload[0]
+        masked_filename = f"{primary_doc['stored']}.combined.masked.txt"
         masked_path = os.path.join("outputs", masked_filename)
         os.makedirs("outputs", exist_ok=True)
         
-        with open(masked_path, "w", encoding="utf-8") as f:
-            f.write(masked_text)
+        # Encoded once and written in one call: a payload larger than the buffer
+        # goes straight to the fd (no text-layer chunking/newline translation)
+        with open(masked_path, "wb") as f:
+            f.write(masked_text.encode("utf-8"))
         
         analysis.masked_text_path = masked_path
         analysis.reverse_mapping_json = masking.serialize_mapping(reverse_mapping)
+        # One commit before the LLM call: ends the transaction so the pooled
+        # connection isn't held idle for the minutes the model takes
         db.commit()
         
         # 4. LLM Analysis
-        safe_policy_type = ''.join(c for c in policy_type if c.isalnum() or c in ('_', '-'))
-        if not safe_policy_type:
-            safe_policy_type = "rc_generale"
-        
-        # Determina la cartella base e il tipo di polizza
-        if analysis_level == "sinistro":
-            base_folder = "analisi_sinistri"
-            # Rimuovi "rc_generale" -> "rc" per sinistri
-            folder_type = safe_policy_type.replace("rc_generale", "rc")
-            # Nuova convenzione: prompt_sinistro_{type}.txt
-            prompt_path = f"prompts/{base_folder}/{folder_type}/prompt_sinistro_{folder_type}.txt"
-            template_path = f"prompts/{base_folder}/{folder_type}/template_sinistro_{folder_type}.html"
-            
-        elif safe_policy_type == "analisi_economica":
-            base_folder = "analisi_economica"
-            folder_type = "standard" # Default folder for now
-            # Naming convention: prompt_{type}_{variant}.txt
-            prompt_path = f"prompts/{base_folder}/{folder_type}/prompt_analisi_economica_standard.txt"
-            template_path = f"prompts/{base_folder}/{folder_type}/template_analisi_economica_standard.html"
-        elif safe_policy_type == "analisi_capitolati":
-            base_folder = "analisi_capitolati"
-            folder_type = "standard" # Default folder for now
-            prompt_path = f"prompts/{base_folder}/{folder_type}/prompt_analisi_capitolati.txt"
-            template_path = f"prompts/{base_folder}/{folder_type}/template_analisi_capitolati.html"
-        else:
-            base_folder = "analisi_polizze"
-            folder_type = safe_policy_type
-            # Nuova convenzione: prompt_{type}_{level}.txt
-            prompt_path = f"prompts/{base_folder}/{folder_type}/prompt_{folder_type}_{analysis_level}.txt"
-            template_path = f"prompts/{base_folder}/{folder_type}/template_{folder_type}_{analysis_level}.html"
-        
-        # Fallback per file non trovati
-        if not os.path.exists(prompt_path):
-            # Prova con nome generico base.txt
-            fallback_prompt = f"prompts/{base_folder}/{folder_type}/base.txt"
-            if os.path.exists(fallback_prompt):
-                prompt_path = fallback_prompt
-            else:
-                print(f"WARNING: Prompt file not found: {prompt_path}")
-        
-        if not os.path.exists(template_path):
-            # Prova con nome generico template.html
-            fallback_template = f"prompts/{base_folder}/{folder_type}/template.html"
-            if os.path.exists(fallback_template):
-                template_path = fallback_template
-            else:
-                print(f"WARNING: Template file not found: {template_path}")
+        safe_policy_type = _UNSAFE_POLICY_CHARS_RE.sub('', policy_type) or "rc_generale"
+        
+        prompt_path, template_path = resolve_prompt_paths(safe_policy_type, analysis_level)
         
         print(f"DEBUG: Using prompt: {prompt_path}")
         print(f"DEBUG: Using template: {template_path}")
         
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            prompt_template = f.read()
-        
-        with open(template_path, "r", encoding="utf-8") as f:
-            html_template = f.read()
+        prompt_template = load_prompt_file(prompt_path)
+        html_template = load_prompt_file(template_path)
         
         client = llm_client.LLMClient(model_name=llm_model)
         report_masked, report_display, input_tokens, output_tokens = client.analyze(
@@ -892,18 +1115,20 @@ async def correct_analysis(
     if analysis.document_id and analysis.document_id not in doc_ids:
         doc_ids.append(analysis.document_id)
     
-    original_text = ""
+    text_parts = []
     if doc_ids:
-        documents = db.query(models.Document).filter(models.Document.id.in_(doc_ids)).all()
+        documents = db.query(models.Document.extracted_text_path).filter(models.Document.id.in_(doc_ids)).all()
         
         # Load text from extracted_text_path files
         for doc in documents:
-            if doc.extracted_text_path and os.path.exists(doc.extracted_text_path):
-                try:
-                    with open(doc.extracted_text_path, 'r', encoding='utf-8') as f:
-                        original_text += f.read() + "\n\n"
-                except Exception as e:
-                    print(f"Error loading text from {doc.extracted_text_path}: {e}")
+            try:
+                content = read_text_file_if_exists(doc.extracted_text_path)
+            except Exception as e:
+                print(f"Error loading text from {doc.extracted_text_path}: {e}")
+                continue
+            if content is not None:
+                text_parts.append(content + "\n\n")
+    original_text = "".join(text_parts)
     
     # Use masked version for LLM to protect sensitive data
     # Falls back to display version if masked not available (shouldn't happen in production)
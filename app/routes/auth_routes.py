@@ -9,6 +9,7 @@ import asyncio
 from ..database import get_db
 from .. import models, auth
 from ..utils.password_validator import validate_password_strength
+from ..utils import login_throttle
 
 router = APIRouter()
 
@@ -64,22 +65,37 @@ async def login(
         (models.User.username == credentials.username)
     ).first()
     
-    # Check if account is locked (rate limiting)
-    if user and user.locked_until and user.locked_until > datetime.utcnow():
+    # Throttle on the account email when it exists, so email/username logins share one counter
+    throttle_key = user.email if user else credentials.username
+    
+    # Check if account is locked (rate limiting) - before paying for bcrypt
+    remaining_seconds = login_throttle.get_lock_remaining_seconds(throttle_key)
+    if not remaining_seconds and user and user.locked_until and user.locked_until > datetime.utcnow():
         remaining_seconds = (user.locked_until - datetime.utcnow()).total_seconds()
+    if remaining_seconds:
         remaining_minutes = int(remaining_seconds / 60) + 1
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"Account bloccato per troppi tentativi. Riprova tra {remaining_minutes} minuti."
         )
     
-    if not user or not auth.verify_password(credentials.password, user.password_hash):
-        # Increment login attempts for existing user
-        if user:
+    if not user or not auth.verify_password(credentials.password, user.password_hash, user.password_algo):
+        # Count the failure in Redis (no UPDATE on users per failed attempt)
+        counted = login_throttle.register_failure(
+            throttle_key, MAX_LOGIN_ATTEMPTS, LOCKOUT_DURATION_MINUTES * 60
+        )
+        if counted:
+            fails, locked = counted
+        elif user:
+            # No shared store (or Redis down): count on the user row, seen by every worker
             user.login_attempts = (user.login_attempts or 0) + 1
-            
+            fails = user.login_attempts
+            locked = fails >= MAX_LOGIN_ATTEMPTS
+        
+        if user:
             # Lock account if max attempts reached
-            if user.login_attempts >= MAX_LOGIN_ATTEMPTS:
+            if locked:
+                # Persist the lock (for admin visibility, and the check above without Redis)
                 user.locked_until = datetime.utcnow() + timedelta(minutes=LOCKOUT_DURATION_MINUTES)
                 db.commit()
                 raise HTTPException(
@@ -87,8 +103,9 @@ async def login(
                     detail=f"Account bloccato per troppi tentativi. Riprova tra {LOCKOUT_DURATION_MINUTES} minuti."
                 )
             
-            db.commit()
-            remaining_attempts = MAX_LOGIN_ATTEMPTS - user.login_attempts
+            if not counted:
+                db.commit()
+            remaining_attempts = MAX_LOGIN_ATTEMPTS - fails
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail=f"Credenziali non valide. {remaining_attempts} tentativi rimasti."
@@ -100,9 +117,15 @@ async def login(
         )
     
     # Successful login - reset login attempts
+    login_throttle.reset(throttle_key)
     user.login_attempts = 0
     user.locked_until = None
     
+    # Silently upgrade hashes created with an older algorithm or cost
+    if auth.needs_rehash(user.password_hash, user.password_algo):
+        user.password_hash = auth.get_password_hash(credentials.password)
+        user.password_algo = auth.DEFAULT_PASSWORD_ALGO
+    
     # Check if user is active
     if not user.is_active:
         raise HTTPException(
@@ -212,7 +235,7 @@ async def change_password(
         )
     
     # Verify current password
-    if not auth.verify_password(payload.current_password, user.password_hash):
+    if not auth.verify_password(payload.current_password, user.password_hash, user.password_algo):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Password attuale non corretta"
@@ -223,6 +246,7 @@ async def change_password(
     
     # Update password
     user.password_hash = auth.get_password_hash(payload.new_password)
+    user.password_algo = auth.DEFAULT_PASSWORD_ALGO
     db.commit()
     
     return MessageResponse(message="Password aggiornata con successo")
@@ -319,8 +343,10 @@ async def reset_password(
     
     # Update password
     user.password_hash = auth.get_password_hash(payload.new_password)
+    user.password_algo = auth.DEFAULT_PASSWORD_ALGO
     
     # Reset login attempts and unlock account
+    login_throttle.reset(user.email)
     user.login_attempts = 0
     user.locked_until = None
     
@@ -0,0 +1,148 @@
+import asyncio
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, or_
+from sqlalchemy.dialects import postgresql, sqlite
+from ..database import SessionLocal
+from .. import models
+
+# Expired reset tokens are kept for a week (audit), then deleted
+RESET_TOKEN_RETENTION_DAYS = 7
+# The jobs run once a night, after this hour (UTC); every worker process
+# checks periodically and only the one that claims the night's slot runs them
+MAINTENANCE_HOUR_UTC = 3
+MAINTENANCE_CHECK_SECONDS = 15 * 60
+NIGHTLY_JOB = "nightly"
+# Already rolled-up days are recomputed this far back (analyses completing late)
+USAGE_ROLLUP_REFRESH_DAYS = 7
+
+def purge_expired_reset_tokens() -> int:
+    """
+    Delete password reset tokens expired more than RESET_TOKEN_RETENTION_DAYS ago.
+    Returns the number of deleted rows.
+    """
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=RESET_TOKEN_RETENTION_DAYS)
+        deleted = db.query(models.PasswordResetToken).filter(
+            models.PasswordResetToken.expires_at < cutoff
+        ).delete(synchronize_session=False)
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+def _dialect_insert(db):
+    return sqlite.insert if db.bind.dialect.name == "sqlite" else postgresql.insert
+
+def nightly_slot_start(now: datetime) -> datetime:
+    """Start of the maintenance slot `now` falls in (last MAINTENANCE_HOUR_UTC:00)"""
+    slot = now.replace(hour=MAINTENANCE_HOUR_UTC, minute=0, second=0, microsecond=0)
+    return slot if now >= slot else slot - timedelta(days=1)
+
+def claim_nightly_run(job: str = NIGHTLY_JOB) -> bool:
+    """
+    True for exactly one caller per nightly slot, across worker processes:
+    a conditional UPDATE of the job's last_run_at, which the database
+    serializes (a concurrent claim re-checks the condition and matches no row).
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        db.execute(
+            _dialect_insert(db)(models.MaintenanceRun)
+            .values(job=job, last_run_at=None)
+            .on_conflict_do_nothing(index_elements=[models.MaintenanceRun.job])
+        )
+        claimed = db.query(models.MaintenanceRun).filter(
+            models.MaintenanceRun.job == job,
+            or_(
+                models.MaintenanceRun.last_run_at.is_(None),
+                models.MaintenanceRun.last_run_at < nightly_slot_start(now)
+            )
+        ).update({models.MaintenanceRun.last_run_at: now}, synchronize_session=False)
+        db.commit()
+        return claimed == 1
+    finally:
+        db.close()
+
+def refresh_usage_rollup() -> int:
+    """
+    Recompute analysis_usage_daily for the closed days (before today) since the
+    last rollup minus USAGE_ROLLUP_REFRESH_DAYS - everything on the first run.
+    Returns the number of days written.
+    """
+    db = SessionLocal()
+    try:
+        today_start = datetime.combine(date.today(), datetime.min.time())
+        last_day = db.query(func.max(models.AnalysisUsageDaily.date)).scalar()
+        since = last_day - timedelta(days=USAGE_ROLLUP_REFRESH_DAYS) if last_day else None
+        
+        day = func.date(models.Analysis.created_at)
+        query = db.query(
+            day.label('day'),
+            func.coalesce(func.sum(models.Analysis.input_tokens), 0).label('input_tokens'),
+            func.coalesce(func.sum(models.Analysis.output_tokens), 0).label('output_tokens')
+        ).filter(
+            models.Analysis.status == models.AnalysisStatus.COMPLETED,
+            models.Analysis.created_at < today_start
+        )
+        stale = db.query(models.AnalysisUsageDaily)
+        if since:
+            query = query.filter(models.Analysis.created_at >= datetime.combine(since, datetime.min.time()))
+            stale = stale.filter(models.AnalysisUsageDaily.date >= since)
+        rows = query.group_by(day).all()
+        
+        values = [
+            {
+                # SQLite's date() returns 'YYYY-MM-DD', Postgres a date
+                "date": date.fromisoformat(row.day) if isinstance(row.day, str) else row.day,
+                "input_tokens": int(row.input_tokens),
+                "output_tokens": int(row.output_tokens)
+            }
+            for row in rows
+        ]
+        if values:
+            stmt = _dialect_insert(db)(models.AnalysisUsageDaily).values(values)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.AnalysisUsageDaily.date],
+                set_={
+                    "input_tokens": stmt.excluded.input_tokens,
+                    "output_tokens": stmt.excluded.output_tokens
+                }
+            )
+            db.execute(stmt)
+        # Days in the window that no longer have usage (analyses deleted)
+        stale.filter(
+            models.AnalysisUsageDaily.date.notin_([v["date"] for v in values])
+        ).delete(synchronize_session=False)
+        db.commit()
+        return len(values)
+    finally:
+        db.close()
+
+async def run_nightly_maintenance():
+    """
+    Background loop started at app startup in every worker process: the
+    cleanup/rollup jobs run once a night, in the process that claims the slot.
+    """
+    while True:
+        try:
+            claimed = await asyncio.to_thread(claim_nightly_run)
+        except Exception as e:
+            print(f"[MAINTENANCE] Could not claim the nightly run: {e}")
+            claimed = False
+        if not claimed:
+            await asyncio.sleep(MAINTENANCE_CHECK_SECONDS)
+            continue
+        try:
+            deleted = await asyncio.to_thread(purge_expired_reset_tokens)
+            if deleted:
+                print(f"[MAINTENANCE] Purged {deleted} expired password reset tokens")
+        except Exception as e:
+            print(f"[MAINTENANCE] Reset token purge failed: {e}")
+        try:
+            days = await asyncio.to_thread(refresh_usage_rollup)
+            print(f"[MAINTENANCE] Usage rollup refreshed ({days} days)")
+        except Exception as e:
+            print(f"[MAINTENANCE] Usage rollup failed: {e}")
+        await asyncio.sleep(MAINTENANCE_CHECK_SECONDS)
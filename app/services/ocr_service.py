@@ -1,9 +1,16 @@
 import os
+import threading
+from ..config import settings
 from ..database import SessionLocal
 from .. import models
 from .. import ocr
 from .. import llm_client
 
+# Caps concurrent OCR jobs: each one can spawn Tesseract/Doctr workers, so an
+# upload burst would otherwise exhaust RAM. Extra jobs wait for a free slot.
+# (Background tasks run in the threadpool, hence a threading semaphore.)
+OCR_SEMAPHORE = threading.BoundedSemaphore(max(1, settings.MAX_CONCURRENT_OCR_JOBS))
+
 def process_ocr_background(document_id: int, file_path: str, mime_type: str):
     """
     Background task to process OCR for a document.
@@ -20,7 +27,8 @@ def process_ocr_background(document_id: int, file_path: str, mime_type: str):
 
     # Process OCR
     try:
-        text, method = ocr.process_document(file_path, mime_type)
+        with OCR_SEMAPHORE:
+            text, method = ocr.process_document(file_path, mime_type)
     except Exception as e:
         print(f"OCR Failed for {document_id}: {e}")
         return
@@ -0,0 +1,125 @@
+"""In-process cache for the SystemSettings singleton row"""
+
+import threading
+import time
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from . import models
+
+# The singleton is always this row: reads and writes address it by id
+SETTINGS_ROW_ID = 1
+
+# The row changes maybe once a week (admin edits), while it is read on every
+# analysis start and every analytics hit. Other workers pick up an admin
+# change within the TTL, the worker that served the PUT immediately.
+SETTINGS_CACHE_TTL_SECONDS = 60
+
+_cache_lock = threading.Lock()
+_cached_settings = None
+_cached_at = 0.0
+_cached_rates = None  # (settings instance, (input_cost, output_cost))
+
+
+def get_settings_cached(db: Session):
+    """
+    Return the SystemSettings row (or None if it doesn't exist yet).
+
+    The returned instance is detached from the session: treat it as read-only.
+    To modify settings, query the row explicitly and call
+    invalidate_settings_cache() after the commit.
+    """
+    global _cached_settings, _cached_at
+
+    with _cache_lock:
+        if _cached_settings is not None and time.monotonic() - _cached_at < SETTINGS_CACHE_TTL_SECONDS:
+            return _cached_settings
+
+    settings = db.get(models.SystemSettings, SETTINGS_ROW_ID)
+    if settings is None:
+        return None
+
+    # Detach so the cached object survives the request's session
+    db.expunge(settings)
+
+    with _cache_lock:
+        _cached_settings = settings
+        _cached_at = time.monotonic()
+    return settings
+
+
+def init_settings_row(db: Session):
+    """
+    Startup: make sure the singleton exists as row SETTINGS_ROW_ID, so GET
+    paths never have to write. A legacy row created with another id is
+    renumbered instead of getting a second row next to it.
+    """
+    if db.get(models.SystemSettings, SETTINGS_ROW_ID) is not None:
+        return
+    legacy = db.query(models.SystemSettings).order_by(models.SystemSettings.id).first()
+    if legacy is not None:
+        legacy.id = SETTINGS_ROW_ID
+    else:
+        db.add(models.SystemSettings(id=SETTINGS_ROW_ID))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()  # Another worker process got there first
+
+
+def ensure_settings(db: Session):
+    """
+    Return the SystemSettings row (SETTINGS_ROW_ID) attached to the session,
+    inserting it with the column defaults if it doesn't exist. For writes.
+
+    One INSERT ... ON CONFLICT DO UPDATE ... RETURNING round-trip whether the
+    row exists or not (and no race between two first requests). The caller commits.
+    """
+    dialect_insert = sqlite.insert if db.bind.dialect.name == "sqlite" else postgresql.insert
+    stmt = dialect_insert(models.SystemSettings).values(id=SETTINGS_ROW_ID)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.SystemSettings.id],
+        # No-op update so RETURNING also yields an already existing row
+        set_={"id": stmt.excluded.id},
+    ).returning(models.SystemSettings)
+    return db.scalars(stmt, execution_options={"populate_existing": True}).one()
+
+
+def _parse_cost(settings, column) -> float:
+    """Cost column as float, falling back to the column default (no row / bad value)"""
+    default = float(getattr(models.SystemSettings, column).default.arg)
+    value = getattr(settings, column, None) if settings is not None else None
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+def get_cost_rates_cached(db: Session) -> tuple[float, float]:
+    """(input, output) USD per million tokens, parsed once per cached row"""
+    global _cached_rates
+
+    settings = get_settings_cached(db)
+    with _cache_lock:
+        if _cached_rates is not None and _cached_rates[0] is settings:
+            return _cached_rates[1]
+
+    rates = (
+        _parse_cost(settings, 'input_cost_per_million'),
+        _parse_cost(settings, 'output_cost_per_million'),
+    )
+    with _cache_lock:
+        _cached_rates = (settings, rates)
+    return rates
+
+
+def invalidate_settings_cache():
+    """Drop the cached row (call after any write to system_settings)"""
+    global _cached_settings, _cached_at, _cached_rates
+
+    with _cache_lock:
+        _cached_settings = None
+        _cached_at = 0.0
+        _cached_rates = None
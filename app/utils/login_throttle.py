@@ -0,0 +1,75 @@
+"""
+Failed-login throttling
+Counts failures in Redis (shared across workers) when REDIS_URL is set and
+redis is installed, keeping failed logins from writing to the users table.
+Without Redis ENABLED is False: the login route keeps counting on the user
+row (users.login_attempts), which is shared by all workers and survives restarts.
+A Redis error never fails a login: the helpers log it and the route falls back
+to the same users-table counter.
+"""
+from typing import Optional
+
+from ..config import settings
+
+try:
+    import redis
+    HAS_REDIS = True
+except ImportError:
+    HAS_REDIS = False
+
+FAIL_WINDOW_SECONDS = 900  # Failures older than this are forgotten
+
+ENABLED = HAS_REDIS and bool(settings.REDIS_URL)
+
+_redis = redis.Redis.from_url(settings.REDIS_URL) if ENABLED else None
+
+
+def _normalize(identifier: str) -> str:
+    return (identifier or "").strip().lower()
+
+
+def get_lock_remaining_seconds(identifier: str) -> int:
+    """Seconds left on an active lockout, 0 if not locked (or throttling disabled)"""
+    if not ENABLED:
+        return 0
+    try:
+        ttl = _redis.ttl(f"login:lock:{_normalize(identifier)}")
+    except redis.RedisError as e:
+        print(f"[LOGIN THROTTLE] Redis unavailable, lock check skipped: {e}")
+        return 0
+    return ttl if ttl and ttl > 0 else 0
+
+
+def register_failure(identifier: str, max_attempts: int, lockout_seconds: int) -> Optional[tuple[int, bool]]:
+    """
+    Record a failed login.
+    Returns (failed_attempts, locked) - locked is True when this failure triggered
+    the lockout - or None when it was not counted (throttling disabled or Redis
+    unavailable): the caller counts on the user row instead.
+    """
+    if not ENABLED:
+        return None
+    key = _normalize(identifier)
+    try:
+        pipe = _redis.pipeline()
+        pipe.incr(f"login:fail:{key}")
+        pipe.expire(f"login:fail:{key}", FAIL_WINDOW_SECONDS)
+        fails, _ = pipe.execute()
+        fails = int(fails)
+        if fails >= max_attempts:
+            _redis.setex(f"login:lock:{key}", lockout_seconds, "1")
+            return fails, True
+    except redis.RedisError as e:
+        print(f"[LOGIN THROTTLE] Redis unavailable, counting on the user row: {e}")
+        return None
+    return fails, False
+
+
+def reset(identifier: Optional[str]):
+    """Clear failures and lockout (successful login, password reset)"""
+    if ENABLED and identifier:
+        key = _normalize(identifier)
+        try:
+            _redis.delete(f"login:fail:{key}", f"login:lock:{key}")
+        except redis.RedisError as e:
+            print(f"[LOGIN THROTTLE] Redis unavailable, counters not cleared: {e}")
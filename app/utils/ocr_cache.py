@@ -0,0 +1,92 @@
+"""
+Persistent OCR result cache
+SQLite file keyed by the document's SHA-256 (plus the OCR settings), so a
+re-upload / retry / pipeline replay of the same PDF skips the OCR entirely,
+across restarts and worker processes. Only OCR'd documents are stored:
+native-text PDFs are cheap to re-extract.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+OCR_DISK_CACHE = os.getenv("OCR_DISK_CACHE", "true").lower() == "true"
+OCR_CACHE_PATH = os.getenv("OCR_CACHE_PATH", "./ocr_cache.db")
+OCR_CACHE_MAX_ENTRIES = int(os.getenv("OCR_CACHE_MAX_ENTRIES", 500))  # Least recently used beyond this are dropped
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    conn = sqlite3.connect(OCR_CACHE_PATH, timeout=10)
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS ocr_results ("
+                    " key TEXT PRIMARY KEY,"
+                    " text TEXT NOT NULL,"
+                    " method TEXT NOT NULL,"
+                    " last_used REAL NOT NULL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_ocr_results_last_used ON ocr_results (last_used)")
+                conn.commit()
+                _initialized = True
+    return conn
+
+
+def file_digest(file_path: str) -> str:
+    """SHA-256 of the file content, read in 1 MB chunks"""
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def get(key: str) -> Optional[tuple[str, str]]:
+    """(text, method) for a cached document, None on miss or when disabled"""
+    if not OCR_DISK_CACHE:
+        return None
+    try:
+        conn = _connect()
+        try:
+            row = conn.execute("SELECT text, method FROM ocr_results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE ocr_results SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            return row[0], row[1]
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Warning: OCR cache read failed: {e}")
+        return None
+
+
+def put(key: str, text: str, method: str):
+    """Store a result and evict the least recently used entries past OCR_CACHE_MAX_ENTRIES"""
+    if not OCR_DISK_CACHE:
+        return
+    try:
+        conn = _connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO ocr_results (key, text, method, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, method, time.time()),
+            )
+            conn.execute(
+                "DELETE FROM ocr_results WHERE key IN ("
+                " SELECT key FROM ocr_results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (OCR_CACHE_MAX_ENTRIES,),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print(f"Warning: OCR cache write failed: {e}")
@@ -0,0 +1,33 @@
+"""
+Reading of extracted text files
+OCR output can be several MB per document: the file is memory-mapped and
+decoded straight from the mapping, skipping the read() copy into a bytes
+buffer and TextIOWrapper's chunked decoding.
+"""
+import mmap
+import os
+from typing import Optional
+
+
+def read_text_file(path: str) -> str:
+    """UTF-8 content of a text file, with universal newlines like open(path, 'r')"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""  # mmap can't map an empty file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)  # Linux/Python 3.8+: read-ahead hint
+            text = str(mm, "utf-8")
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text
+
+
+def read_text_file_if_exists(path: Optional[str]) -> Optional[str]:
+    """read_text_file, or None for a missing path/file (one open instead of exists() + open)"""
+    if not path:
+        return None
+    try:
+        return read_text_file(path)
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,11 @@
+-- Migration: Add password_algo column to users table
+-- Date: 2026-10-16
+-- Reason: Store the hashing algorithm next to the hash so login picks the verifier directly
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS password_algo VARCHAR(16) DEFAULT 'bcrypt';
+
+-- All existing hashes were created with bcrypt
+UPDATE users SET password_algo = 'bcrypt' WHERE password_algo IS NULL;
+
+-- Verify change
+SELECT password_algo, COUNT(*) FROM users GROUP BY password_algo;
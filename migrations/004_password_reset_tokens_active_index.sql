@@ -0,0 +1,13 @@
+-- Migration: Partial index on unused password reset tokens + purge of old rows
+-- Date: 2026-10-16
+-- Reason: Token lookups only target unused tokens; keep that index small.
+-- Note: now() is not immutable, so expiry can't be part of the index predicate;
+--       expired rows are removed by the nightly maintenance task instead.
+
+CREATE INDEX IF NOT EXISTS ix_prt_active ON password_reset_tokens (token) WHERE used = false;
+
+-- One-off purge of tokens expired more than 7 days ago
+DELETE FROM password_reset_tokens WHERE expires_at < now() - interval '7 days';
+
+-- Verify change
+SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'password_reset_tokens';
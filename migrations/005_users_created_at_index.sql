@@ -0,0 +1,9 @@
+-- Migration: Composite index for keyset pagination of the admin user list
+-- Date: 2026-10-16
+-- Reason: GET /api/admin/users pages with ORDER BY created_at DESC, id DESC
+--         and WHERE (created_at, id) < (:cursor_created_at, :cursor_id)
+
+CREATE INDEX IF NOT EXISTS ix_users_created_at_id ON users (created_at DESC, id DESC);
+
+-- Verify change
+SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'users';
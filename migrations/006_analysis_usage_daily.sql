@@ -0,0 +1,15 @@
+-- Migration: Daily token usage rollup for the admin cost dashboard
+-- Date: 2026-10-16
+-- Reason: GET /api/admin/analytics/costs summed tokens over the whole analyses
+--         table on every hit. Closed days are now rolled up nightly
+--         (app/services/maintenance.py) and only the days after the last
+--         rollup are aggregated live.
+
+CREATE TABLE IF NOT EXISTS analysis_usage_daily (
+    date DATE PRIMARY KEY,
+    input_tokens BIGINT DEFAULT 0,
+    output_tokens BIGINT DEFAULT 0
+);
+
+-- Verify change
+SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'analysis_usage_daily';
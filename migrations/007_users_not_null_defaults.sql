@@ -0,0 +1,26 @@
+-- Migration: NOT NULL + server defaults on user flags and token counters
+-- Date: 2026-10-16
+-- Reason: The admin API builds UserListItem straight from the row
+--         (from_attributes) instead of coalescing NULLs in Python per user
+
+UPDATE users SET is_admin = FALSE WHERE is_admin IS NULL;
+UPDATE users SET is_active = TRUE WHERE is_active IS NULL;
+UPDATE users SET total_input_tokens = 0 WHERE total_input_tokens IS NULL;
+UPDATE users SET total_output_tokens = 0 WHERE total_output_tokens IS NULL;
+UPDATE users SET total_tokens_used = 0 WHERE total_tokens_used IS NULL;
+
+ALTER TABLE users
+    ALTER COLUMN is_admin SET DEFAULT FALSE,
+    ALTER COLUMN is_admin SET NOT NULL,
+    ALTER COLUMN is_active SET DEFAULT TRUE,
+    ALTER COLUMN is_active SET NOT NULL,
+    ALTER COLUMN total_input_tokens SET DEFAULT 0,
+    ALTER COLUMN total_input_tokens SET NOT NULL,
+    ALTER COLUMN total_output_tokens SET DEFAULT 0,
+    ALTER COLUMN total_output_tokens SET NOT NULL,
+    ALTER COLUMN total_tokens_used SET DEFAULT 0,
+    ALTER COLUMN total_tokens_used SET NOT NULL;
+
+-- Verify change
+SELECT column_name, is_nullable, column_default FROM information_schema.columns
+WHERE table_name = 'users' AND column_name IN ('is_admin', 'is_active', 'total_input_tokens', 'total_output_tokens', 'total_tokens_used');
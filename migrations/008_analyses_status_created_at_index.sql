@@ -0,0 +1,10 @@
+-- Migration: Composite index for the cost analytics aggregates
+-- Date: 2026-10-16
+-- Reason: GET /api/admin/analytics/costs and the nightly usage rollup filter
+--         analyses on status = 'COMPLETED' AND created_at >= :start (half-open
+--         ranges, no date() on the column), which this index serves directly
+
+CREATE INDEX IF NOT EXISTS ix_analyses_status_created_at ON analyses (status, created_at);
+
+-- Verify change
+SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'analyses';
@@ -0,0 +1,13 @@
+-- Migration: Claim table for the nightly maintenance jobs
+-- Date: 2026-10-16
+-- Reason: the maintenance loop runs in every uvicorn worker. Each night one
+--         process claims the run with a conditional UPDATE on this row, so
+--         the token purge and the usage rollup run once, not once per worker.
+
+CREATE TABLE IF NOT EXISTS maintenance_runs (
+    job VARCHAR(50) PRIMARY KEY,
+    last_run_at TIMESTAMP
+);
+
+-- Verify change
+SELECT column_name, data_type FROM information_schema.columns WHERE table_name = 'maintenance_runs';
@@ -0,0 +1,19 @@
+-- Migration: NOT NULL + server default on users.created_at
+-- Date: 2026-10-16
+-- Reason: The admin user list is keyset-paginated on (created_at, id). A NULL
+--         created_at breaks the cursor of a page ending on that row, and such
+--         rows never match the (created_at, id) < cursor filter of later pages.
+--         Legacy rows without a date get the oldest known one (they predate
+--         the column default), or now on a table with no dates at all.
+
+UPDATE users
+SET created_at = COALESCE((SELECT MIN(created_at) FROM users), CURRENT_TIMESTAMP)
+WHERE created_at IS NULL;
+
+ALTER TABLE users
+    ALTER COLUMN created_at SET DEFAULT CURRENT_TIMESTAMP,
+    ALTER COLUMN created_at SET NOT NULL;
+
+-- Verify change
+SELECT column_name, is_nullable, column_default FROM information_schema.columns
+WHERE table_name = 'users' AND column_name = 'created_at';
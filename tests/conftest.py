@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its settings at import time: point it at a throwaway SQLite
+# database (and a valid secret) before any test module imports it
+_TMP_DIR = tempfile.mkdtemp(prefix="insurance-analyzer-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}"
+os.environ["SECRET_KEY"] = "test-secret-key-" + "x" * 32
+os.environ["REDIS_URL"] = ""
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    """Session on freshly created tables, dropped again after the test"""
+    from app.database import Base, SessionLocal, engine
+    from app import models  # noqa: F401 - registers the tables on Base
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def admin_request():
+    """Stand-in for a Request with an admin logged in (routes only read .session)"""
+    class _Request:
+        session = {"user": {"id": 1, "email": "admin@example.com", "is_admin": True}}
+    return _Request()
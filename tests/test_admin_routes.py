@@ -0,0 +1,83 @@
+import json
+from datetime import date, datetime, timedelta
+
+from app import models
+from app.routes import admin_routes
+from app.services import maintenance
+
+
+def test_users_cursor_round_trip():
+    created_at = datetime(2026, 3, 1, 12, 30, 45, 123456)
+    cursor = admin_routes.encode_users_cursor(created_at, 42)
+
+    assert admin_routes.decode_users_cursor(cursor) == (created_at, 42)
+
+
+def test_list_users_pages_through_created_at_ties(db, admin_request):
+    # Bulk imports share created_at: the id tie-break must neither skip nor repeat rows
+    base = datetime(2026, 1, 1, 9, 0, 0)
+    created = [base] * 5 + [base + timedelta(minutes=1)] * 4 + [base - timedelta(days=1)] * 3
+    db.add_all([
+        models.User(email=f"user{i}@example.com", password_hash="x", created_at=created_at)
+        for i, created_at in enumerate(created)
+    ])
+    db.commit()
+    expected = [
+        user_id for user_id, _ in db.query(models.User.id, models.User.created_at)
+        .order_by(models.User.created_at.desc(), models.User.id.desc())
+    ]
+
+    seen = []
+    totals = []
+    cursor = None
+    while True:
+        response = admin_routes.list_users(admin_request, limit=4, cursor=cursor, db=db)
+        page = json.loads(response.body)
+        seen.extend(user["id"] for user in page["users"])
+        totals.append(page["total"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == expected
+    assert len(set(seen)) == len(created)
+    # COUNT(*) only on the first page
+    assert totals == [len(created), None, None]
+
+
+def test_cost_analytics_rollup_matches_live_query(db, admin_request):
+    today = datetime.combine(date.today(), datetime.min.time())
+    usage = [
+        # (days ago, input tokens, output tokens, status)
+        (70, 1000, 200, models.AnalysisStatus.COMPLETED),
+        (40, 3000, 500, models.AnalysisStatus.COMPLETED),
+        (40, 7000, 900, models.AnalysisStatus.ERROR),
+        (3, 1500, 300, models.AnalysisStatus.COMPLETED),
+        (1, 2500, 700, models.AnalysisStatus.COMPLETED),
+        (1, 500, 100, models.AnalysisStatus.COMPLETED),
+        (0, 4000, 800, models.AnalysisStatus.COMPLETED),
+        (0, 9000, 900, models.AnalysisStatus.ANALYZING),
+    ]
+    db.add_all([
+        models.Analysis(
+            status=status,
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            total_tokens=input_tokens + output_tokens,
+            created_at=today - timedelta(days=days_ago) + timedelta(hours=10)
+        )
+        for days_ago, input_tokens, output_tokens, status in usage
+    ])
+    db.commit()
+
+    # Empty rollup: everything comes from the live query over analyses
+    live_only = admin_routes.get_cost_analytics(admin_request, db=db)
+
+    assert maintenance.refresh_usage_rollup() == 4  # Closed days with completed analyses
+    assert db.query(models.AnalysisUsageDaily).count() == 4
+
+    split = admin_routes.get_cost_analytics(admin_request, db=db)
+
+    assert split.model_dump() == live_only.model_dump()
+    assert split.total.input_tokens == 12500
+    assert split.today.input_tokens == 4000
@@ -0,0 +1,33 @@
+import pytest
+
+redis = pytest.importorskip("redis")
+
+from app.utils import login_throttle  # noqa: E402
+
+
+class _DownRedis:
+    """Client whose every call fails like an unreachable server"""
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise redis.ConnectionError("Connection refused")
+        return fail
+
+
+@pytest.fixture
+def redis_down(monkeypatch):
+    monkeypatch.setattr(login_throttle, "ENABLED", True)
+    monkeypatch.setattr(login_throttle, "_redis", _DownRedis())
+
+
+def test_redis_outage_falls_back_to_user_row(redis_down):
+    assert login_throttle.get_lock_remaining_seconds("user@example.com") == 0
+    # None: not counted, the login route counts on users.login_attempts
+    assert login_throttle.register_failure("user@example.com", 5, 900) is None
+    login_throttle.reset("user@example.com")
+
+
+def test_disabled_throttle_does_not_count(monkeypatch):
+    monkeypatch.setattr(login_throttle, "ENABLED", False)
+
+    assert login_throttle.get_lock_remaining_seconds("user@example.com") == 0
+    assert login_throttle.register_failure("user@example.com", 5, 900) is None
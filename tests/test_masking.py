@@ -0,0 +1,51 @@
+from app.masking import mask_chunks, mask_document
+
+SENSITIVE_DATA = {
+    'numero_polizza': '123456789',
+    'contraente': 'Mario Rossi S.r.l.',
+    'codice_fiscale': 'RSSMRA80A01H501Z',
+    'assicurato': 'Mario Rossi',
+    'altri': ['Via Roma 15', 'info@azienda.it'],
+}
+
+# Header + content pieces, as the analysis route builds them per document
+CHUNKS = [
+    "\n\n--- DOCUMENTO: polizza.pdf ---\n\n",
+    "Polizza n. 123456789 stipulata da Mario Rossi S.r.l. (CF RSSMRA80A01H501Z).\n"
+    "Sede: via roma 15. Assicurato: MARIO ROSSI.\n",
+    "\n\n--- DOCUMENTO: appendice.pdf ---\n\n",
+    "Appendice alla polizza 123456789. Contatti: info@azienda.it\n",
+]
+
+
+def test_mask_chunks_matches_mask_document():
+    chunks = list(CHUNKS)
+    replacements, reverse_mapping = mask_chunks(chunks, SENSITIVE_DATA)
+
+    masked_text, expected_replacements, expected_mapping = mask_document("".join(CHUNKS), SENSITIVE_DATA)
+
+    assert "".join(chunks) == masked_text
+    assert replacements == expected_replacements
+    assert reverse_mapping == expected_mapping
+    # Occurrences are summed over all the pieces
+    polizza = next(r for r in replacements if r['mascherato'] == '[POLIZZA_XXX]')
+    assert polizza['occorrenze'] == 2
+
+
+def test_mask_chunks_masks_in_place():
+    chunks = list(CHUNKS)
+    mask_chunks(chunks, SENSITIVE_DATA)
+
+    assert len(chunks) == len(CHUNKS)
+    assert chunks[0] == CHUNKS[0]
+    assert "123456789" not in chunks[3]
+    assert "[DATO_OSCURATO_2]" in chunks[3]
+
+
+def test_mask_chunks_value_across_chunks_is_not_found():
+    chunks = ["Polizza n. 1234", "56789 in vigore"]
+    replacements, reverse_mapping = mask_chunks(chunks, {'numero_polizza': '123456789'})
+
+    assert chunks == ["Polizza n. 1234", "56789 in vigore"]
+    assert replacements == []
+    assert reverse_mapping == {}
@@ -0,0 +1,105 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("pytesseract")
+
+from app import ocr  # noqa: E402
+
+
+def _page_text(label: str, page_num: int) -> str:
+    """Readable text, long enough to beat any native word count below"""
+    return " ".join(f"{label}{page_num}parola{i}" for i in range(60))
+
+
+def _native(page_num: int) -> str:
+    return f"nativo pagina {page_num}"
+
+
+# page -> what the stubbed OCR finds: 'embedded' (images are enough),
+# 'full' (only the full-page render) or None (OCR doesn't beat the native text)
+OCR_OUTCOME = {1: 'embedded', 2: 'full', 4: None, 5: 'embedded', 6: 'full'}
+NUM_PAGES = 8
+
+
+@pytest.fixture
+def stub_ocr(monkeypatch):
+    """Replace the MuPDF/Tesseract steps; random delays shuffle the completion order"""
+    def delay():
+        time.sleep(random.uniform(0, 0.02))
+
+    def extract_page_images(page, page_num):
+        return [page]
+
+    def ocr_page_images(images, page_num, osd_cache, text_cache):
+        delay()
+        return _page_text("img", page_num) if OCR_OUTCOME[page_num] == 'embedded' else ""
+
+    def render_page_image(page, zoom=ocr.OCR_RENDER_ZOOM):
+        return page
+
+    def ocr_full_page(img, run_osd=True, label=""):
+        delay()
+        return _page_text("full", img) if OCR_OUTCOME[img] == 'full' else ""
+
+    monkeypatch.setattr(ocr, "extract_page_images", extract_page_images)
+    monkeypatch.setattr(ocr, "ocr_page_images", ocr_page_images)
+    monkeypatch.setattr(ocr, "render_page_image", render_page_image)
+    monkeypatch.setattr(ocr, "ocr_full_page", ocr_full_page)
+    monkeypatch.setattr(ocr, "append_debug_log", lambda msg: None)
+
+
+def _page_data():
+    # (word count, native text, rotation, quality_good); a "page" is its number
+    return [(3, _native(n), 0, True) for n in range(NUM_PAGES)]
+
+
+def _expected_text(page_num: int) -> str:
+    outcome = OCR_OUTCOME.get(page_num)
+    if outcome == 'embedded':
+        return _page_text("img", page_num)
+    if outcome == 'full':
+        return _page_text("full", page_num)
+    return _native(page_num)
+
+
+def test_hybrid_pipeline_keeps_page_order(stub_ocr):
+    page_data = _page_data()
+    combined_text = [native for _, native, _, _ in page_data]
+    doc = list(range(NUM_PAGES))
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        ocr._hybrid_ocr_pipeline(
+            doc, executor, ocr._pipeline_slots(4), page_data, sorted(OCR_OUTCOME), combined_text
+        )
+
+    assert combined_text == [_expected_text(n) for n in range(NUM_PAGES)]
+
+
+def test_process_pdf_sequential_assembles_pages(stub_ocr):
+    page_data = _page_data()
+    doc = list(range(NUM_PAGES))
+
+    text = ocr.process_pdf_sequential("unused.pdf", page_data, set(OCR_OUTCOME), NUM_PAGES, doc=doc)
+
+    assert text == "\n".join(_expected_text(n) for n in range(NUM_PAGES))
+
+
+def test_full_page_osd_follows_rotation_metadata_only():
+    # A readable header/footer layer doesn't make the scan upright
+    assert ocr.full_page_needs_osd(30, 0, has_images=False)
+    assert ocr.full_page_needs_osd(0, 0, has_images=True)
+    assert not ocr.full_page_needs_osd(30, 90, has_images=True)
+    # Near-blank page with nothing scanned on it
+    assert not ocr.full_page_needs_osd(0, 0, has_images=False)
+
+
+def test_born_digital_pages_render_at_lower_zoom():
+    assert ocr.pick_ocr_zoom(20, 0, has_images=False) == ocr.OCR_TEXT_PAGE_ZOOM
+    # Possible scans keep the full zoom
+    assert ocr.pick_ocr_zoom(20, 0, has_images=True) == ocr.OCR_RENDER_ZOOM
+    assert ocr.pick_ocr_zoom(0, 0, has_images=False) == ocr.OCR_RENDER_ZOOM
+    assert ocr.pick_ocr_zoom(20, 90, has_images=False) == ocr.OCR_RENDER_ZOOM
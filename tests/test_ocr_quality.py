@@ -0,0 +1,43 @@
+import random
+
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("pytesseract")
+
+from app import ocr  # noqa: E402
+
+
+def _reference_quality_good(text: str) -> bool:
+    """The per-character implementation is_text_quality_good replaced"""
+    if not text or len(text.strip()) < 20:
+        return False
+    alnum_count = sum(1 for c in text if c.isalnum())
+    total_chars = len(text.replace(" ", "").replace("\n", ""))
+    if total_chars == 0:
+        return False
+    if alnum_count / total_chars < 0.60:
+        return False
+    words = text.split()
+    if len(words) > 10:
+        if sum(1 for w in words if len(w) <= 2) / len(words) > 0.5:
+            return False
+        if sum(1 for c in text if c in ocr._UNUSUAL_CHARS) > len(text) * 0.05:
+            return False
+    return True
+
+
+# Italian text, separators, unusual chars and astral-plane alphanumerics (𝐀 𝟙) / symbols (😀)
+ALPHABET = "abcdefghilmnopqrstuvzàèéìòù0123456789  \n.,;:-'°«»§←→∈\U0001D400\U0001D7D9\U0001F600"
+
+
+def test_quality_check_matches_reference():
+    rng = random.Random(1234)
+    for _ in range(3000):
+        text = "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 120)))
+        assert ocr.is_text_quality_good(text) == _reference_quality_good(text), repr(text)
+
+
+def test_astral_alphanumerics_count_as_alnum():
+    text = "\U0001D400\U0001D401\U0001D402 " * 10
+    assert ocr.is_text_quality_good(text)